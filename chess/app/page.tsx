@@ -45,27 +45,44 @@ export default function ChessBoard() {
   const [message, setMessage] = useState("CARREGANDO...")
   const [board, setBoard] = useState<(string | null)[][]>([])
 
-  // Simular chamada da API
+  // Atualizações empurradas pelo servidor (SSE): o primeiro evento traz o estado atual
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        // Simulando uma API call - substitua pela sua API real
-        const response = await fetch('http://localhost:5000/status')
-        console.log(response)
-        const data = await response.json()
+    const applyStatus = (data: { message: string; fen: string }) => {
+      setMessage(data.message)
+      setBoard(fenToBoard(data.fen))
+    }
 
-        setMessage(data.message)
-        setBoard(fenToBoard(data.fen))
-      } catch (error) {
-        console.error("Erro ao buscar dados:", error)
+    let polling: ReturnType<typeof setInterval> | undefined
+
+    // Sem vaga para o SSE (503), consulta /status; o cache do navegador manda o ETag
+    const poll = async () => {
+      try {
+        const response = await fetch('http://localhost:5000/status', { cache: "no-cache" })
+        if (response.ok) {
+          applyStatus(await response.json())
+        }
+      } catch {
         setMessage("ERRO NA CONEXÃO")
       }
     }
 
-    fetchData()
+    // O EventSource reconecta sozinho e reenvia o último ID recebido
+    const events = new EventSource('http://localhost:5000/events')
+    events.addEventListener("status", (event) => {
+      applyStatus(JSON.parse((event as MessageEvent).data))
+    })
+    events.onerror = () => {
+      if (events.readyState === EventSource.CLOSED && polling === undefined) {
+        // Só fecha de vez se o servidor recusou a conexão
+        poll()
+        polling = setInterval(poll, 1000)
+      }
+    }
 
-    const interval = setInterval(fetchData, 1000)
-    return () => clearInterval(interval)
+    return () => {
+      events.close()
+      clearInterval(polling)
+    }
   }, [])
 
   return (
@@ -0,0 +1,186 @@
+#include <link.hpp>
+
+RobotLink::RobotLink(const char* host, int port, const char* session) {
+    this->host    = host;
+    this->port    = port;
+    this->session = session;
+    this->boot    = String(esp_random(), HEX);
+    for (int i = 0; i < LINK_SEEN; i++) seen[i] = 0;
+}
+
+void RobotLink::write(JsonDocument& message) {
+    serializeJson(message, client);
+    client.print("\n");
+}
+
+bool RobotLink::readLine(JsonDocument& message, unsigned long timeout) {
+    unsigned long start = millis();
+    while (!client.available()) {
+        if (!client.connected() or millis() - start >= timeout) return false;
+        delay(2);
+    }
+    client.setTimeout(timeout);
+    String line = client.readStringUntil('\n');
+    return line.length() > 0 and !deserializeJson(message, line);
+}
+
+bool RobotLink::connect() {
+    if (client.connected()) return true;
+    if (!client.connect(host, port)) return false;
+    // Mensagens pequenas e esperadas: sem agrupar pacotes
+    client.setNoDelay(true);
+
+    JsonDocument hello;
+    hello["type"]    = "hello";
+    hello["session"] = session;
+    hello["boot"]    = boot;
+    write(hello);
+
+    JsonDocument welcome;
+    if (!readLine(welcome, 3000) or welcome["type"] != "welcome") {
+        client.stop();
+        return false;
+    }
+    // Para comparar com o expires dos comandos
+    clockOffset   = welcome["time"].as<long long>() - (long long)millis();
+    String remote = welcome["boot"].as<String>();
+    if (remote != serverBoot) {
+        // O servidor reiniciou e numera as mensagens a partir de 1 de novo
+        for (int i = 0; i < LINK_SEEN; i++) seen[i] = 0;
+        serverBoot = remote;
+    }
+    Serial.println("Conectado ao servidor!");
+    return true;
+}
+
+long long RobotLink::serverTime() {
+    return (long long)millis() + clockOffset;
+}
+
+bool RobotLink::accept(JsonDocument& message) {
+    // Confirma toda mensagem numerada e diz se ela ainda não tinha chegado
+    if (message["seq"].isNull()) return true;
+    int seq = message["seq"];
+
+    JsonDocument ack;
+    ack["type"] = "ack";
+    ack["ack"]  = seq;
+    write(ack);
+
+    for (int i = 0; i < LINK_SEEN; i++) {
+        if (seen[i] == seq) return false;
+    }
+    seen[seenNext] = seq;
+    seenNext       = (seenNext + 1) % LINK_SEEN;
+    return true;
+}
+
+void RobotLink::stash(JsonDocument& message) {
+    if (inboxSize < LINK_INBOX) {
+        serializeJson(message, inbox[inboxSize++]);
+    }
+}
+
+bool RobotLink::take(JsonDocument& message, const char* type, int re) {
+    // Tira da fila a primeira mensagem do tipo (e resposta a re, se >= 0)
+    for (int i = 0; i < inboxSize; i++) {
+        deserializeJson(message, inbox[i]);
+        if (message["type"] != type or (re >= 0 and message["re"] != re)) continue;
+        for (int j = i + 1; j < inboxSize; j++) inbox[j - 1] = inbox[j];
+        inbox[--inboxSize] = "";
+        return true;
+    }
+    return false;
+}
+
+bool RobotLink::next(JsonDocument& message) {
+    while (client.available()) {
+        if (readLine(message, 100) and message["type"] != "ack" and accept(message)) {
+            return true;
+        }
+    }
+    return false;
+}
+
+int RobotLink::send(JsonDocument& message) {
+    // Para-e-espera: reenvia até o ack chegar, reconectando se preciso
+    message["seq"] = ++seq;
+    for (int attempt = 0; attempt <= LINK_MAX_RETRIES; attempt++) {
+        if (!connect()) {
+            delay(LINK_RETRY_MS);
+            continue;
+        }
+        write(message);
+
+        unsigned long start = millis();
+        while (millis() - start < LINK_RETRY_MS and client.connected()) {
+            JsonDocument in;
+            if (!readLine(in, LINK_RETRY_MS - (millis() - start))) continue;
+            if (in["type"] == "ack") {
+                if (in["ack"] == seq) return seq;
+            } else if (accept(in)) {
+                stash(in);
+            }
+        }
+    }
+    return -1;
+}
+
+bool RobotLink::request(const char* action, JsonDocument& result, unsigned long timeout) {
+    JsonDocument message;
+    message["type"]   = "request";
+    message["action"] = action;
+    int sent          = send(message);
+    if (sent < 0) return false;
+
+    unsigned long start = millis();
+    while (millis() - start < timeout) {
+        JsonDocument in;
+        if (take(in, "result", sent)) {
+            result.set(in["result"]);
+            return in["ok"];
+        }
+        if (next(in)) {
+            stash(in);
+        } else {
+            if (!client.connected()) connect();
+            delay(5);
+        }
+    }
+    return false;
+}
+
+void RobotLink::poll(CommandHandler handler) {
+    JsonDocument in;
+    if (!take(in, "command", -1)) {
+        // Respostas que ninguém mais espera
+        inboxSize = 0;
+        if (!client.connected()) {
+            // Sem travar o botão de confirmação tentando reconectar a todo instante
+            if (millis() - lastConnect < LINK_RETRY_MS) return;
+            lastConnect = millis();
+            if (!connect()) return;
+        }
+        if (!next(in) or in["type"] != "command") return;
+    }
+
+    JsonDocument done;
+    done["type"] = "done";
+    done["re"]   = in["seq"];
+
+    if (!in["expires"].isNull() and in["expires"].as<long long>() < serverTime()) {
+        // O servidor já desistiu deste comando: mover o braço agora seria tarde demais
+        Serial.printf("Comando %s vencido, ignorado\n", in["command"].as<const char*>());
+        done["ok"]    = false;
+        done["error"] = "expired";
+        send(done);
+        return;
+    }
+
+    JsonDocument result;
+    handler(in["command"], in["data"], result);
+
+    done["ok"]     = true;
+    done["result"] = result;
+    send(done);
+}
@@ -0,0 +1,48 @@
+#pragma once
+
+#include <Arduino.h>
+#include <ArduinoJson.h>
+#include <WiFi.h>
+
+// Conexão persistente com o servidor (server/src/robot_link.py): uma
+// mensagem JSON por linha, com número de sequência, confirmação (ack) e
+// reenvio. Comandos do servidor que chegam durante uma espera ficam
+// guardados até o próximo poll(), que descarta os vencidos (expires).
+
+#define LINK_RETRY_MS 1000
+#define LINK_MAX_RETRIES 5
+#define LINK_SEEN 16
+#define LINK_INBOX 4
+
+typedef void (*CommandHandler)(const char* command, JsonObject data, JsonDocument& result);
+
+class RobotLink {
+    WiFiClient  client;
+    const char* host;
+    int         port;
+    const char* session;
+    String      boot;
+    String      serverBoot;
+    int         seq = 0;
+    int         seen[LINK_SEEN];
+    int         seenNext = 0;
+    String      inbox[LINK_INBOX];
+    int         inboxSize   = 0;
+    unsigned long lastConnect = 0;
+    long long   clockOffset = 0;  // relógio do servidor - millis()
+
+    void write(JsonDocument& message);
+    bool readLine(JsonDocument& message, unsigned long timeout);
+    bool accept(JsonDocument& message);
+    bool next(JsonDocument& message);
+    void stash(JsonDocument& message);
+    bool take(JsonDocument& message, const char* type, int re);
+    long long serverTime();
+
+   public:
+    RobotLink(const char* host, int port, const char* session);
+    bool connect();
+    int  send(JsonDocument& message);
+    bool request(const char* action, JsonDocument& result, unsigned long timeout = 60000);
+    void poll(CommandHandler handler);
+};
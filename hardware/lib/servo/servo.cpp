@@ -47,6 +47,11 @@ void ServoChess::moveStep(int target, int step) {
     this->move(current+step, 1, 300);
 }
 
+void ServoChess::write(int target) {
+    servo.writeMicroseconds(target);
+    position = target;
+}
+
 void ServoChess::pos_default() {
     this->move(this->initial);
 }
\ No newline at end of file
@@ -14,5 +14,6 @@ class ServoChess {
     ServoChess(int pin, int position);
     void move(int target, float percent = 1.0, int duration = 1000, int steps = 50);
     void moveStep(int target, int step);
+    void write(int target);
     void pos_default();
 };
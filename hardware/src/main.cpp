@@ -3,6 +3,7 @@
 #include <HTTPClient.h>
 
 #include <board.hpp>
+#include <link.hpp>
 #include <servo.hpp>
 #include <utils.hpp>
 
@@ -12,11 +13,15 @@
 #define pinConfirm 25
 #define pinMagnet 32
 
+#define MAX_PLAN_STEPS 64
+#define PLAN_TICK_MS 20
+
 ServoChess  servoBase(pinServoBase, POS_INITIAL.base);
 ServoChess  servoLeft(pinServoLeft, POS_INITIAL.left);
 ServoChess  servoRight(pinServoRight, POS_INITIAL.right);
 HTTPClient  http;
 const char* server  = "http://172.20.10.8:5000";
+RobotLink   robotLink("172.20.10.8", 5001, "default");
 Bounce      confirm = Bounce();
 
 class Move {
@@ -39,6 +44,9 @@ class BestMove {
     Move to;
     bool captured;
     int  castling;
+    // Waypoints do servidor: {base, left, right, ms, magnet}
+    int  plan[MAX_PLAN_STEPS][5];
+    int  planSteps = 0;
 
     BestMove() {
     }
@@ -115,11 +123,21 @@ void gotoPositionDefault() {
     servoBase.pos_default();
 }
 
-void waitKey() {
+void handleCommand(const char* command, JsonObject data, JsonDocument& result);
+bool serverPlayed = false;
+
+bool waitKey() {
+    // Retorna true se o servidor fez o robô jogar durante a espera
+    serverPlayed = false;
     while (1) {
+        // Enquanto espera o botão, atende os comandos que o servidor mandar
+        robotLink.poll(handleCommand);
+        if (serverPlayed) {
+            return true;
+        }
         confirm.update();
         if (confirm.fell()) {
-            break;
+            return false;
         }
     }
 }
@@ -132,48 +150,66 @@ void enableMagnet() {
     digitalWrite(pinMagnet, HIGH);
 }
 
+bool serverRequest(const char* action, JsonDocument& result) {
+    // Pela conexão persistente; sem ela, uma requisição HTTP como antes
+    if (robotLink.connect()) {
+        return robotLink.request(action, result);
+    }
+
+    String url = String(server) + String("/") + String(action);
+    http.begin(url);
+    int  httpCode = http.GET();
+    bool ok       = httpCode == 200 and !deserializeJson(result, http.getString());
+    http.end();
+
+    Serial.printf("HTTP CODE DE %s: %d\n", action, httpCode);
+    return ok;
+}
+
 void captureBoardState() {
     gotoPositionCamera();
     delay(500);
-    String url = String(server) + String("/capture-board-state");
-    http.begin(url);
-    int httpCode = http.GET();
-    http.end();
+    JsonDocument result;
+    serverRequest("capture-board-state", result);
 }
 
-BestMove getBestMove() {
-    String url = String(server) + String("/get-best-move");
-    http.begin(url);
-    int httpCode = http.GET();
-
-    Serial.println(httpCode);
-    Serial.printf("HTTP CODE DO BEST MOVE: %d\n", httpCode);
-
-    if (httpCode == 200) {
-        String payload = http.getString();
-        Serial.println(payload);
-        StaticJsonDocument<256> doc;
-        DeserializationError    error = deserializeJson(doc, payload);
-
-        if (!error) {
-            int  from_row = doc["from"][0];
-            int  from_col = doc["from"][1];
-            int  to_row   = doc["to"][0];
-            int  to_col   = doc["to"][1];
-            bool captured = doc["captured"];
-            int  castling = doc["castling"];
-            Move from(from_row, from_col);
-            Move to(to_row, to_col);
-
-            Serial.printf("From: (%d, %d)\n", from_row, from_col);
-            Serial.printf("To: (%d, %d)\n", to_row, to_col);
-            Serial.printf("Captured: %d Castling: %d\n", captured, castling);
-
-            return BestMove(from, to, captured, castling);
+BestMove parseBestMove(JsonVariant doc) {
+    int  from_row = doc["from"][0];
+    int  from_col = doc["from"][1];
+    int  to_row   = doc["to"][0];
+    int  to_col   = doc["to"][1];
+    bool captured = doc["captured"];
+    int  castling = doc["castling"];
+    Move from(from_row, from_col);
+    Move to(to_row, to_col);
+
+    Serial.printf("From: (%d, %d)\n", from_row, from_col);
+    Serial.printf("To: (%d, %d)\n", to_row, to_col);
+    Serial.printf("Captured: %d Castling: %d\n", captured, castling);
+
+    BestMove move(from, to, captured, castling);
+    JsonArray steps = doc["plan"]["steps"];
+    if (!steps.isNull() && steps.size() > MAX_PLAN_STEPS) {
+        // Plano maior que o buffer: joga com os movimentos antigos
+        Serial.printf("Plano com %d passos ignorado (máximo %d)\n", (int)steps.size(), MAX_PLAN_STEPS);
+    } else if (!steps.isNull()) {
+        for (JsonArray step : steps) {
+            for (int i = 0; i < 5; i++) {
+                move.plan[move.planSteps][i] = step[i];
+            }
+            move.planSteps++;
         }
     }
+    Serial.printf("Plan: %d steps\n", move.planSteps);
 
-    http.end();
+    return move;
+}
+
+BestMove getBestMove() {
+    JsonDocument doc;
+    if (serverRequest("get-best-move", doc)) {
+        return parseBestMove(doc.as<JsonVariant>());
+    }
 
     Serial.println("Deu merdaaa!!!!!!!!!!!!!!!");
 
@@ -183,9 +219,35 @@ BestMove getBestMove() {
     return BestMove();
 }
 
-void executeRobotMove(BestMove move) {
+void executePlan(BestMove &move) {
+    for (int s = 0; s < move.planSteps; s++) {
+        int *step = move.plan[s];
+        digitalWrite(pinMagnet, step[4] ? HIGH : LOW);
+
+        int startBase  = servoBase.position;
+        int startLeft  = servoLeft.position;
+        int startRight = servoRight.position;
+        int ticks      = max(step[3] / PLAN_TICK_MS, 1);
+
+        // Os três servos andam juntos, em linha reta até o waypoint
+        for (int i = 1; i <= ticks; i++) {
+            float t = (float)i / ticks;
+            servoBase.write(startBase + (step[0] - startBase) * t);
+            servoLeft.write(startLeft + (step[1] - startLeft) * t);
+            servoRight.write(startRight + (step[2] - startRight) * t);
+            delay(step[3] / ticks);
+        }
+    }
+}
+
+void executeRobotMove(BestMove &move) {
     Serial.println("Executando jogada no ROBO...");
 
+    if (move.planSteps > 0) {
+        executePlan(move);
+        return;
+    }
+
     gotoPositionDefault();
 
     ServoPosition  from = CHESSBOARD_POSITIONS[move.from.row][move.from.column];
@@ -262,9 +324,20 @@ void executeRobotMove(BestMove move) {
     }
 }
 
-void waitOpponentMove() {
+void handleCommand(const char* command, JsonObject data, JsonDocument& result) {
+    Serial.printf("Comando do servidor: %s\n", command);
+    if (strcmp(command, "play") == 0) {
+        // Jogada iniciada pelo servidor (modo /watch)
+        BestMove move = parseBestMove(data);
+        executeRobotMove(move);
+        result["executed"] = true;
+        serverPlayed       = true;
+    }
+}
+
+bool waitOpponentMove() {
     Serial.println("15 segundos para fazer a jogada");
-    waitKey();
+    return waitKey();
 }
 
 void confirmRobotMove() {
@@ -273,10 +346,8 @@ void confirmRobotMove() {
 }
 
 void resetGame() {
-    String url = String(server) + String("/reset");
-    http.begin(url);
-    int httpCode = http.GET();
-    http.end();
+    JsonDocument result;
+    serverRequest("reset", result);
 }
 
 void setup() {
@@ -315,17 +386,25 @@ void loop() {
     // while (1);
 
     captureBoardState();
-    waitOpponentMove();
 
-    int httpCode = -1;
-
-    while (httpCode < 0) {
-        String url = String(server) + String("/confirm-opponent-move");
+    JsonDocument result;
+    while (true) {
+        if (waitOpponentMove()) {
+            // O servidor viu a jogada pela câmera e o braço já respondeu:
+            // pedir outra jogada faria o robô jogar pelas brancas
+            confirmRobotMove();
+            return;
+        }
 
-        http.begin(url);
-        httpCode = http.GET();
-        http.end();
-        Serial.printf("HTT CODE: %d\n", httpCode);
+        while (!serverRequest("confirm-opponent-move", result)) {
+            delay(500);
+        }
+        if (result["accepted"]) {
+            break;
+        }
+        // Jogada não reconhecida: sem pedir a do robô, o oponente ajusta as
+        // peças e confirma de novo (a foto de antes continua valendo)
+        Serial.println("Jogada nao reconhecida, confirme de novo");
     }
 
     BestMove move = getBestMove();
@@ -0,0 +1,197 @@
+import math
+import os
+import re
+
+import chess
+
+def _block(source, name):
+    """
+    Numbers of the initializer of the C++ constant name in source.
+    """
+    match = re.search(rf"\b{name}\b[^=;]*=\s*\{{", source)
+    if match is None:
+        raise ValueError(f"{name} not found")
+    depth, start = 1, match.end()
+    for end in range(start, len(source)):
+        if source[end] == "{":
+            depth += 1
+        elif source[end] == "}":
+            depth -= 1
+            if depth == 0:
+                break
+    return [float(number) for number in re.findall(r"-?\d+(?:\.\d+)?", source[start:end])]
+
+
+def _table(numbers, width):
+    return [[numbers[(row * 8 + col) * width:(row * 8 + col + 1) * width] for col in range(8)] for row in range(8)]
+
+
+def load_calibration(path):
+    """
+    Reads the arm calibration from the firmware's board.hpp, so the server
+    and the ESP32 share one table: CHESSBOARD_POSITIONS and
+    CHESSBOARD_VERTICAL_TUNNING (indexed [row][col] as returned by
+    square_to_matrix_coords), POS_INITIAL, POS_CAMERA and POS_THRASH.
+    Returns None if the file doesn't exist.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        # Comments carry square names and notes with digits in them
+        source = re.sub(r"//[^\n]*|/\*.*?\*/", "", f.read(), flags=re.S)
+
+    positions = _block(source, "CHESSBOARD_POSITIONS")
+    tuning = _block(source, "CHESSBOARD_VERTICAL_TUNNING")
+    if len(positions) != 64 * 3 or len(tuning) != 64 * 3:
+        raise ValueError(f"{path}: expected 8x8 positions and vertical tuning")
+
+    return {
+        "positions": [[[int(value) for value in pose] for pose in row] for row in _table(positions, 3)],
+        "tuning": [[{"delta_right": int(right), "delta_left": int(left), "percent": percent}
+                    for right, left, percent in row] for row in _table(tuning, 3)],
+        "initial": [int(value) for value in _block(source, "POS_INITIAL")],
+        "camera": [int(value) for value in _block(source, "POS_CAMERA")],
+        "trash": [int(value) for value in _block(source, "POS_THRASH")],
+    }
+
+
+class ArmPlanner:
+    """
+    Compiles a robot move into the arm's whole motion, so the firmware only
+    has to play it back. A plan is a list of waypoints
+
+        [base, left, right, ms, magnet]
+
+    in servo microseconds: the executor sets the magnet (1 on, 0 off), then
+    moves all three servos together to the pose in a straight line over ms
+    milliseconds. A waypoint with the pose unchanged is a pause.
+
+    Each pick or drop follows the firmware's motions: arms folded to
+    POS_INITIAL's left/right angles, base turned over the square, arms
+    lowered percent of the way at travel speed and the rest slowly, in
+    steps of the vertical tuning's deltas, and the way back up the same.
+    Unlike the firmware, the arm doesn't go back to POS_INITIAL between
+    pieces; it only turns the base with the arms folded. A capture is
+    taken to POS_THRASH first, castling moves king and rook in whichever
+    order turns the base less, and en passant removes the pawn beside.
+    """
+
+    def __init__(self, calibration, speed=1.0, step_ms=300, grip_ms=500, release_ms=300, min_ms=50):
+        self.positions = calibration["positions"]
+        self.tuning = calibration["tuning"]
+        self.initial = calibration["initial"]
+        self.camera = calibration["camera"]
+        self.trash = calibration["trash"]
+        self.speed = speed  # µs per ms of the fastest servo
+        self.step_ms = step_ms
+        self.grip_ms = grip_ms
+        self.release_ms = release_ms
+        self.min_ms = min_ms
+
+    def plan(self, board, move, start=None):
+        """
+        Plan for playing move on board (before it is pushed), starting from
+        the pose start (by default POS_CAMERA, where the robot waits for the
+        opponent). Returns {"steps": [...], "ms": total}.
+        """
+        pieces = []
+        if board.is_en_passant(move):
+            captured = chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square))
+            pieces.append((captured, None))
+        elif board.piece_at(move.to_square) is not None and not board.is_castling(move):
+            pieces.append((move.to_square, None))
+
+        if board.is_castling(move):
+            rank = chess.square_rank(move.from_square)
+            kingside = board.is_kingside_castling(move)
+            king = (move.from_square, chess.square(6 if kingside else 2, rank))
+            rook = (chess.square(7 if kingside else 0, rank), chess.square(5 if kingside else 3, rank))
+            orders = [[king, rook], [rook, king]]
+            pieces += min(orders, key=lambda order: self._travel(order, start))
+        else:
+            pieces.append((move.from_square, move.to_square))
+
+        steps = []
+        pose = list(start or self.camera)
+        for origin, target in pieces:
+            pose = self._pick(steps, pose, origin)
+            pose = self._drop(steps, pose, target)
+        return {"steps": steps, "ms": sum(step[3] for step in steps)}
+
+    def _pose(self, square):
+        return self.positions[square_to_row(square)][square_to_col(square)]
+
+    def _vertical(self, square):
+        return self.tuning[square_to_row(square)][square_to_col(square)]
+
+    def _travel(self, pieces, start):
+        base = (start or self.camera)[0]
+        total = 0
+        for origin, target in pieces:
+            for square in (origin, target):
+                reach = self._pose(square)[0] if square is not None else self.trash[0]
+                total += abs(reach - base)
+                base = reach
+        return total
+
+    def _move(self, steps, pose, target, magnet, ms=None):
+        if ms is None:
+            if list(target) == pose:
+                return pose
+            ms = max(self.min_ms, math.ceil(max(abs(a - b) for a, b in zip(pose, target)) / self.speed))
+        steps.append([*target, ms, magnet])
+        return list(target)
+
+    def _lower(self, steps, pose, target, vertical, magnet):
+        # Folded arms first, so the base never sweeps over the pieces
+        pose = self._move(steps, pose, [pose[0], self.initial[1], self.initial[2]], magnet)
+        pose = self._move(steps, pose, [target[0], *pose[1:]], magnet)
+
+        percent = vertical["percent"]
+        approach = [target[0]] + [round(p + (t - p) * percent) for p, t in zip(pose[1:], target[1:])]
+        pose = self._move(steps, pose, approach, magnet)
+        if approach != target:
+            pose = self._move(steps, pose, target, magnet, self._slow(pose, target, vertical))
+        return pose
+
+    def _raise(self, steps, pose, vertical, magnet):
+        folded = [pose[0], self.initial[1], self.initial[2]]
+        percent = 1 - vertical["percent"]
+        clear = [pose[0]] + [round(p + (t - p) * percent) for p, t in zip(pose[1:], folded[1:])]
+        if clear != pose:
+            pose = self._move(steps, pose, clear, magnet, self._slow(pose, clear, vertical))
+        return self._move(steps, pose, folded, magnet)
+
+    def _slow(self, pose, target, vertical):
+        # The firmware's stepping loop: one tuning delta per servo every
+        # step_ms, until either servo runs out of steps
+        steps = min(abs(pose[1] - target[1]) // vertical["delta_left"],
+                    abs(pose[2] - target[2]) // vertical["delta_right"])
+        return max(self.min_ms, steps * self.step_ms)
+
+    def _pick(self, steps, pose, square):
+        vertical = self._vertical(square)
+        pose = self._lower(steps, pose, self._pose(square), vertical, 0)
+        pose = self._move(steps, pose, pose, 1, self.grip_ms)
+        return self._raise(steps, pose, vertical, 1)
+
+    def _drop(self, steps, pose, square):
+        if square is None:
+            # Captured pieces go to the trash, dropped from above
+            pose = self._move(steps, pose, [self.trash[0], *pose[1:]], 1)
+            pose = self._move(steps, pose, self.trash, 1)
+            pose = self._move(steps, pose, pose, 0, self.release_ms)
+            return self._move(steps, pose, [pose[0], self.initial[1], self.initial[2]], 0)
+        vertical = self._vertical(square)
+        pose = self._lower(steps, pose, self._pose(square), vertical, 1)
+        pose = self._move(steps, pose, pose, 0, self.release_ms)
+        return self._raise(steps, pose, vertical, 0)
+
+
+def square_to_row(square):
+    return chess.square_rank(square)
+
+
+def square_to_col(square):
+    # Same mirroring as main.square_to_matrix_coords
+    return 7 - chess.square_file(square)
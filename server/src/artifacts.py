@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from diff import board_matrix
+
+KINDS = ("before", "after", "overlay")
+
+
+class ArtifactCache:
+    """
+    The frames behind the last few moves of a session, kept for debugging
+    and encoded to JPEG only when someone asks for them.
+
+    Frames are stored by reference (the camera never reuses an array), per
+    move number (the ply when the move was captured), and only the last
+    max_moves are kept. Encoded images are cached by (ply, kind, quality,
+    width), up to max_encoded of them.
+    """
+
+    def __init__(self, max_moves=8, max_encoded=32):
+        self.max_moves = max_moves
+        self.max_encoded = max_encoded
+        self.moves = OrderedDict()
+        self.encoded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, ply, kind, frame, **details):
+        """
+        Stores a frame of the move at ply. details (scores, calibration) are
+        kept for the overlay.
+        """
+        with self.lock:
+            move = self.moves.setdefault(ply, {})
+            move[kind] = frame
+            move.update(details)
+            self.moves.move_to_end(ply)
+            while len(self.moves) > self.max_moves:
+                self.moves.popitem(last=False)
+
+            # A new frame replaces the old encodings of this move
+            for key in [key for key in self.encoded if key[0] == ply]:
+                del self.encoded[key]
+
+    def available(self):
+        with self.lock:
+            return {ply: [kind for kind in KINDS if self._source(move, kind)]
+                    for ply, move in self.moves.items()}
+
+    @staticmethod
+    def _source(move, kind):
+        if kind == "overlay":
+            return "after" in move and move.get("scores") is not None and move.get("calibration") is not None
+        return kind in move
+
+    def jpeg(self, ply, kind, quality=80, width=None):
+        """
+        Returns the JPEG bytes of the artifact, or None if it isn't stored.
+        width (at least 1) scales the image down to a thumbnail; quality is
+        clamped to 1-100.
+        """
+        if width is not None and width < 1:
+            raise ValueError(f"width must be at least 1, got {width}")
+        quality = min(max(int(quality), 1), 100)
+        key = (ply, kind, quality, width)
+        with self.lock:
+            if key in self.encoded:
+                self.encoded.move_to_end(key)
+                return self.encoded[key]
+            move = self.moves.get(ply)
+            if move is None or not self._source(move, kind):
+                return None
+            move = dict(move)
+
+        image = render_overlay(move["after"], move["scores"], move["calibration"]) if kind == "overlay" else move[kind]
+        if width and width < image.shape[1]:
+            height = max(1, round(image.shape[0] * width / image.shape[1]))
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        data = buffer.tobytes()
+
+        with self.lock:
+            self.encoded[key] = data
+            while len(self.encoded) > self.max_encoded:
+                self.encoded.popitem(last=False)
+        return data
+
+
+def render_overlay(frame, scores, calibration, resolution=400):
+    """
+    Straightened board of the frame with the 8x8 grid drawn on it and each
+    square tinted by its change score, as diff_scores() saw it.
+    """
+    board = cv2.warpPerspective(frame, board_matrix(calibration, frame.shape, resolution), (resolution, resolution))
+    cell = resolution / 8
+
+    tint = np.zeros_like(board)
+    for row in range(8):
+        for col in range(8):
+            score = float(scores[row][col])
+            if score <= 0:
+                continue
+            top_left = (int(col * cell), int(row * cell))
+            bottom_right = (int((col + 1) * cell), int((row + 1) * cell))
+            cv2.rectangle(tint, top_left, bottom_right, (0, 0, int(255 * min(score * 2, 1.0))), -1)
+    board = cv2.addWeighted(board, 1.0, tint, 0.6, 0)
+
+    for i in range(9):
+        position = int(round(i * cell))
+        cv2.line(board, (position, 0), (position, resolution), (255, 255, 255), 1)
+        cv2.line(board, (0, position), (resolution, position), (255, 255, 255), 1)
+    for row in range(8):
+        for col in range(8):
+            if scores[row][col] >= 0.05:
+                cv2.putText(board, f"{scores[row][col]:.2f}", (int(col * cell) + 4, int((row + 1) * cell) - 6),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+    return board
@@ -0,0 +1,170 @@
+"""
+Replays a directory of labelled before/after frame pairs through diff() and
+reports per-stage timings, throughput and detection accuracy.
+
+The directory must contain a labels.json with one entry per pair:
+
+    [
+        {"before": "001_before.jpg", "after": "001_after.jpg", "squares": ["e2", "e4"]},
+        {"before": "002_before.jpg", "after": "002_after.jpg",
+         "fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", "move": "g1f3"}
+    ]
+
+"squares" lists the squares expected to change. With "move" (UCI) they are
+derived from the move, which needs "fen" for castling and en passant; the
+decoded move is then checked as well.
+
+Usage:
+    python3 src/benchmark.py path/to/dataset [--calibrate [--resolution PX]] [--repeat N]
+"""
+import argparse
+import json
+import os
+import tracemalloc
+from time import perf_counter
+
+import chess
+import cv2
+import numpy as np
+
+from decoder import decode_move, expected_squares
+from diff import calibrate, convert_to_chess_notation, diff_scores, get_changed_squares_from_scores
+
+STAGES = ["rotate", "gray", "mask", "contour", "warp", "crop", "diff", "score"]
+
+
+def load_dataset(directory):
+    """
+    Reads labels.json and the frames it points to.
+
+    Returns:
+        List of dicts with the 'name', 'before' and 'after' images, the
+        expected 'squares' (set) and, if labelled, the 'board' and 'move'
+    """
+    with open(os.path.join(directory, "labels.json")) as f:
+        labels = json.load(f)
+
+    pairs = []
+    for label in labels:
+        before = cv2.imread(os.path.join(directory, label["before"]))
+        after = cv2.imread(os.path.join(directory, label["after"]))
+        if before is None or after is None:
+            raise FileNotFoundError(f"❌ Could not read {label['before']} / {label['after']}")
+
+        board = chess.Board(label["fen"]) if "fen" in label else None
+        move = chess.Move.from_uci(label["move"]) if "move" in label else None
+
+        if "squares" in label:
+            squares = set(label["squares"])
+        elif move is not None:
+            squares = expected_squares(board, move) if board is not None else [move.from_square, move.to_square]
+            squares = {chess.square_name(square) for square in squares}
+        else:
+            raise ValueError(f"❌ Pair {label['before']} has neither 'squares' nor 'move'.")
+
+        pairs.append({
+            "name": label["before"],
+            "before": before,
+            "after": after,
+            "squares": squares,
+            "board": board,
+            "move": move,
+        })
+
+    return pairs
+
+
+def run(pairs, use_calibration=False, repeat=1, resolution=None):
+    """
+    Runs every pair repeat times through diff_scores(), plus once more
+    under tracemalloc to measure the peak memory of a call.
+
+    Returns:
+        (stage timings, total times, results) where stage timings maps each
+        stage to a list of durations in seconds, and results has one entry
+        per pair with the detected squares, decoded move and peak memory
+    """
+    timings = {name: [] for name in STAGES}
+    totals = []
+    results = []
+
+    for pair in pairs:
+        calibration = calibrate(pair["before"]) if use_calibration else None
+
+        for i in range(repeat):
+            pair_timings = {}
+            start = perf_counter()
+            try:
+                scores = diff_scores(pair["before"], pair["after"], calibration, pair_timings, resolution)
+            except Exception as e:
+                scores = None
+                error = str(e)
+            totals.append(perf_counter() - start)
+
+            for name, duration in pair_timings.items():
+                timings[name].append(duration)
+
+        if scores is None:
+            results.append({"pair": pair, "squares": None, "move": None, "peak": None, "error": error})
+            continue
+
+        tracemalloc.start()
+        diff_scores(pair["before"], pair["after"], calibration, None, resolution)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        detected = set(convert_to_chess_notation(get_changed_squares_from_scores(scores)))
+        move = decode_move(pair["board"], scores)[0] if pair["board"] is not None else None
+        results.append({"pair": pair, "squares": detected, "move": move, "peak": peak, "error": None})
+
+    return timings, totals, results
+
+
+def percentiles(durations):
+    if not durations:
+        return None, None
+    return np.percentile(durations, 50) * 1000, np.percentile(durations, 95) * 1000
+
+
+def report(timings, totals, results):
+    print(f"{'stage':<10}{'p50 (ms)':>10}{'p95 (ms)':>10}")
+    for name in STAGES:
+        p50, p95 = percentiles(timings[name])
+        if p50 is not None:
+            print(f"{name:<10}{p50:>10.2f}{p95:>10.2f}")
+    p50, p95 = percentiles(totals)
+    print(f"{'total':<10}{p50:>10.2f}{p95:>10.2f}")
+
+    print(f"\nThroughput: {len(totals) / sum(totals):.1f} pairs/s")
+
+    peaks = [r["peak"] for r in results if r["peak"] is not None]
+    if peaks:
+        print(f"Peak memory per call: {np.median(peaks) / 1e6:.2f} MB median, {max(peaks) / 1e6:.2f} MB max")
+
+    squares_ok = [r for r in results if r["squares"] == r["pair"]["squares"]]
+    print(f"Square accuracy: {len(squares_ok)}/{len(results)}")
+
+    with_move = [r for r in results if r["pair"]["move"] is not None and r["pair"]["board"] is not None]
+    if with_move:
+        moves_ok = [r for r in with_move if r["move"] == r["pair"]["move"]]
+        print(f"Move accuracy: {len(moves_ok)}/{len(with_move)}")
+
+    for r in results:
+        if r["error"] is not None:
+            print(f"  {r['pair']['name']}: {r['error']}")
+        elif r["squares"] != r["pair"]["squares"]:
+            print(f"  {r['pair']['name']}: expected {sorted(r['pair']['squares'])}, got {sorted(r['squares'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy and latency benchmark for diff()")
+    parser.add_argument("dataset", help="Directory with labels.json and the frame pairs")
+    parser.add_argument("--calibrate", action="store_true", help="Calibrate once per pair and use the fast path")
+    parser.add_argument("--resolution", type=int, help="Working resolution of the lean grayscale path (needs --calibrate)")
+    parser.add_argument("--repeat", type=int, default=1, help="Times each pair is diffed (for timing)")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    pairs = load_dataset(args.dataset)
+    report(*run(pairs, args.calibrate, args.repeat, args.resolution))
@@ -0,0 +1,41 @@
+import os
+
+import chess.polyglot
+
+
+class OpeningBook:
+    """
+    Optional Polyglot (.bin) opening book. While the game is within
+    max_ply half-moves, choose() picks one of the book moves for the
+    position at random, weighted by the book's weights, so the robot's
+    openings vary from game to game.
+
+    If the book file doesn't exist, the book is disabled and choose()
+    always returns None.
+    """
+
+    def __init__(self, path, max_ply=16):
+        self.path = path
+        self.max_ply = max_ply
+        self.reader = chess.polyglot.open_reader(path) if path and os.path.exists(path) else None
+
+    @property
+    def enabled(self):
+        return self.reader is not None
+
+    def choose(self, board):
+        """
+        Returns a book move for this position, or None if the book is
+        disabled, the game is past max_ply or the position isn't in the book.
+        """
+        if self.reader is None or board.ply() >= self.max_ply:
+            return None
+        try:
+            return self.reader.weighted_choice(board).move
+        except IndexError:
+            return None
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
@@ -0,0 +1,309 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+
+
+class FrameGrabber:
+    """
+    Reads the camera continuously on a background thread and keeps the last
+    few frames in a ring buffer, so the V4L2 queue never fills up with stale
+    frames and requests don't have to flush it.
+
+    Frames are handed out as they were read (no copy). cap.read() allocates
+    a new array for every frame, so a returned frame is never overwritten.
+    """
+
+    def __init__(self, cap, size=8):
+        self.cap = cap
+        self.frames = deque(maxlen=size)
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+        self.captured = 0
+        self.read_errors = 0
+        self.dropped = 0
+        self.last_read = 0.0
+        # Time blocked in cap.read() (includes MJPG decoding) and, when the
+        # driver timestamps its buffers (V4L2), the age of each frame when read
+        self.read_times = deque(maxlen=120)
+        self.latencies = deque(maxlen=120)
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self):
+        while self.running:
+            start = time.monotonic()
+            ret, frame = self.cap.read()
+            now = time.monotonic()
+            timestamp = time.time()
+            # V4L2 reports the buffer timestamp on the monotonic clock, in ms
+            latency = now - self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 if ret else None
+
+            with self.condition:
+                self.read_times.append(now - start)
+                if latency is not None and 0 <= latency < 5:
+                    self.latencies.append(latency)
+                if not ret:
+                    self.read_errors += 1
+                else:
+                    # A full buffer evicts its oldest frame; count it if nobody took it
+                    if len(self.frames) == self.frames.maxlen and self.frames[0][0] > self.last_read:
+                        self.dropped += 1
+                    self.frames.append((timestamp, frame))
+                    self.captured += 1
+                self.condition.notify_all()
+
+            if not ret:
+                time.sleep(0.01)
+
+    def latest(self):
+        """
+        Returns the newest (timestamp, frame), or (None, None) before the
+        first frame arrives.
+        """
+        with self.condition:
+            if not self.frames:
+                return None, None
+            timestamp, frame = self.frames[-1]
+            self.last_read = max(self.last_read, timestamp)
+            return timestamp, frame
+
+    def newer_than(self, timestamp, timeout=1.0):
+        """
+        Waits until a frame captured after the given timestamp is available.
+
+        Returns:
+            (timestamp, frame), or (None, None) if none arrives within timeout
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while not self.frames or self.frames[-1][0] <= timestamp:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None, None
+                self.condition.wait(remaining)
+            frame_timestamp, frame = self.frames[-1]
+            self.last_read = max(self.last_read, frame_timestamp)
+            return frame_timestamp, frame
+
+    def stats(self):
+        """
+        Health counters of the grabber. fps is measured over the frames in
+        the buffer.
+        """
+        with self.condition:
+            fps = 0.0
+            if len(self.frames) > 1:
+                elapsed = self.frames[-1][0] - self.frames[0][0]
+                if elapsed > 0:
+                    fps = (len(self.frames) - 1) / elapsed
+            age = time.time() - self.frames[-1][0] if self.frames else None
+
+            return {
+                "running": self.running,
+                "captured": self.captured,
+                "read_errors": self.read_errors,
+                "dropped": self.dropped,
+                "fps": round(fps, 2),
+                "age": age,
+                "read_ms": percentiles_ms(self.read_times),
+                "latency_ms": percentiles_ms(self.latencies),
+            }
+
+
+def percentiles_ms(durations):
+    """
+    Returns {'p50', 'p95'} of the durations in milliseconds, or None if empty.
+    """
+    if not durations:
+        return None
+    ordered = sorted(durations)
+    return {
+        "p50": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+    }
+
+
+class ReplayCapture:
+    """
+    Stand-in for cv2.VideoCapture that replays recorded frames at the given
+    frame rate, for running the server without a camera (development, load
+    tests). source is an image file, a directory of images (played in name
+    order) or a video file; fps defaults to the video's own.
+    """
+
+    def __init__(self, source, fps=None, loop=True):
+        self.video = None
+        self.frames = []
+        if os.path.isdir(source):
+            paths = sorted(os.path.join(source, name) for name in os.listdir(source)
+                           if name.lower().endswith(IMAGE_EXTENSIONS))
+            self.frames = [frame for frame in (cv2.imread(path) for path in paths) if frame is not None]
+        elif source.lower().endswith(IMAGE_EXTENSIONS):
+            self.frames = [frame for frame in [cv2.imread(source)] if frame is not None]
+        else:
+            self.video = cv2.VideoCapture(source)
+            fps = fps or self.video.get(cv2.CAP_PROP_FPS) or None
+
+        self.fps = fps or 30.0
+        self.loop = loop
+        self.index = 0
+        self.next_frame = time.monotonic()
+        self.opened = bool(self.frames) or (self.video is not None and self.video.isOpened())
+
+    def isOpened(self):
+        return self.opened
+
+    def _next(self):
+        if self.video is None:
+            if self.index == len(self.frames) and not self.loop:
+                return None
+            frame = self.frames[self.index % len(self.frames)].copy()
+            self.index = self.index % len(self.frames) + 1
+            return frame
+
+        ret, frame = self.video.read()
+        if not ret and self.loop:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.video.read()
+        return frame if ret else None
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        # Paced like a real camera: read() blocks until the next frame is due
+        delay = self.next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_frame = max(self.next_frame, time.monotonic() - 1.0 / self.fps) + 1.0 / self.fps
+
+        frame = self._next()
+        return frame is not None, frame
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        frame = self.frames[0] if self.frames else None
+        if self.video is not None:
+            return self.video.get(prop)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH and frame is not None:
+            return frame.shape[1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT and frame is not None:
+            return frame.shape[0]
+        return 0.0
+
+    def release(self):
+        self.opened = False
+        if self.video is not None:
+            self.video.release()
+
+
+def load_settings(path):
+    """
+    Reads the camera settings (a JSON object, see camera.json) or returns
+    None if the file doesn't exist.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def camera_settings(camera):
+    """
+    Normalises a camera description to a settings dict. camera is a
+    settings dict already, a device index (int or digit string), an image,
+    a directory of images or a video file (replayed), or anything else
+    OpenCV opens (a device path, a stream URL).
+    """
+    if isinstance(camera, dict):
+        return camera
+    if isinstance(camera, int) or str(camera).isdigit():
+        return {"backend": "device", "device": int(camera)}
+    path = str(camera)
+    if os.path.isdir(path) or (os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)):
+        return {"backend": "replay", "source": camera}
+    # Device path (/dev/video0), stream URL, GStreamer pipeline...
+    return {"backend": "device", "device": camera, "api": "any"}
+
+
+def open_device(settings):
+    """
+    Opens a real camera and applies the format settings. The pixel format
+    (fourcc) goes first: V4L2 drivers pick the available resolutions and
+    frame rates from it. Exposure and white balance are fixed when given,
+    automatic when null.
+    """
+    api = cv2.CAP_V4L2 if settings.get("api", "v4l2") == "v4l2" and os.name == "posix" else cv2.CAP_ANY
+    cap = cv2.VideoCapture(settings.get("device", 0), api)
+
+    if settings.get("fourcc"):
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*settings["fourcc"]))
+    for key, prop in (("width", cv2.CAP_PROP_FRAME_WIDTH), ("height", cv2.CAP_PROP_FRAME_HEIGHT),
+                      ("fps", cv2.CAP_PROP_FPS), ("buffer_size", cv2.CAP_PROP_BUFFERSIZE)):
+        if settings.get(key) is not None:
+            cap.set(prop, settings[key])
+
+    # Set either way: V4L2 keeps the last values across opens, even from another program
+    if settings.get("exposure") is not None:
+        # V4L2: 1 = manual, 3 = aperture priority (auto)
+        cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 1)
+        cap.set(cv2.CAP_PROP_EXPOSURE, settings["exposure"])
+    else:
+        cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 3)
+    if settings.get("white_balance") is not None:
+        cap.set(cv2.CAP_PROP_AUTO_WB, 0)
+        cap.set(cv2.CAP_PROP_WB_TEMPERATURE, settings["white_balance"])
+    else:
+        cap.set(cv2.CAP_PROP_AUTO_WB, 1)
+    return cap
+
+
+def open_capture(camera):
+    """
+    Opens the camera described by camera (see camera_settings()) with the
+    backend it names: "device" for a real camera, "replay" for recorded
+    frames.
+    """
+    settings = camera_settings(camera)
+    if settings.get("backend", "device") == "replay":
+        return ReplayCapture(settings["source"], settings.get("fps"), settings.get("loop", True))
+    return open_device(settings)
+
+
+def describe(cap):
+    """
+    Returns the format the camera actually delivers, which may differ from
+    the settings if the driver rejected some of them.
+    """
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    return {
+        "fourcc": "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)).strip("\x00") or None,
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "fps": cap.get(cv2.CAP_PROP_FPS),
+        "buffer_size": int(cap.get(cv2.CAP_PROP_BUFFERSIZE)),
+    }
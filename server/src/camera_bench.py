@@ -0,0 +1,52 @@
+"""
+Measures what a camera source delivers: the format the driver accepted,
+frames per second, time blocked in read() (which includes MJPG decoding)
+and, for V4L2 devices, the age of each frame when it was read.
+
+The source is a camera settings file (like camera.json), a device index,
+an image, a directory of images or a video file.
+
+Usage:
+    python3 src/camera_bench.py camera.json [--seconds 5]
+"""
+import argparse
+import json
+import time
+
+from camera import FrameGrabber, camera_settings, describe, load_settings, open_capture
+
+
+def measure(camera, seconds=5.0):
+    settings = camera_settings(camera)
+    cap = open_capture(settings)
+    if not cap.isOpened():
+        raise RuntimeError(f"❌ Could not open {settings}")
+
+    delivered = describe(cap)
+    grabber = FrameGrabber(cap, size=int(max(2, seconds * 60))).start()
+    try:
+        time.sleep(seconds)
+        stats = grabber.stats()
+    finally:
+        grabber.stop()
+        cap.release()
+    return settings, delivered, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Camera latency and throughput")
+    parser.add_argument("source", help="Settings file, device index, image, directory or video")
+    parser.add_argument("--seconds", type=float, default=5.0, help="How long to capture")
+    args = parser.parse_args()
+
+    source = load_settings(args.source) if args.source.endswith(".json") else args.source
+    settings, delivered, stats = measure(source, args.seconds)
+    print(f"Backend: {settings.get('backend', 'device')} {json.dumps(settings)}")
+    print(f"Format: {json.dumps(delivered)}")
+    print(f"Frames: {stats['captured']} ({stats['read_errors']} read errors), {stats['fps']:.1f} fps")
+    if stats["read_ms"]:
+        print(f"read(): {stats['read_ms']['p50']:.2f} ms p50, {stats['read_ms']['p95']:.2f} ms p95")
+    if stats["latency_ms"]:
+        print(f"Frame age: {stats['latency_ms']['p50']:.2f} ms p50, {stats['latency_ms']['p95']:.2f} ms p95")
+    else:
+        print("Frame age: not reported by this backend")
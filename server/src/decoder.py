@@ -0,0 +1,80 @@
+import chess
+import numpy as np
+
+
+def square_evidence(scores, saturation=0.2):
+    """
+    Turns the 8x8 change scores from diff_scores() into per-square evidence
+    between 0 (unchanged) and 1 (surely changed).
+
+    Parameters:
+        scores: 8x8 array indexed as (row, col), (0,0) being a8
+        saturation: Score from which a square is considered fully changed
+
+    Returns:
+        An array of 64 values indexed by python-chess square (a1=0 ... h8=63)
+    """
+    evidence = np.clip(np.asarray(scores, dtype=float) / saturation, 0.0, 1.0)
+    # Row 0 is rank 8, so flip the rows to get a1 first
+    return evidence[::-1].reshape(64)
+
+
+def expected_squares(board, move):
+    """
+    Lists every square whose content changes when the move is played:
+    origin and destination, the captured pawn for en passant and the
+    rook's squares for castling.
+    """
+    squares = [move.from_square, move.to_square]
+
+    if board.is_en_passant(move):
+        squares.append(chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square)))
+    elif board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        if board.is_kingside_castling(move):
+            squares += [chess.square(7, rank), chess.square(5, rank)]
+        else:
+            squares += [chess.square(0, rank), chess.square(3, rank)]
+
+    return squares
+
+
+def decode_move(board, scores, saturation=0.2):
+    """
+    Ranks every legal move by how well its squares match the change map.
+
+    A move earns evidence for each of its squares that changed, loses for
+    each of its squares that didn't, and loses for every other square that
+    changed. Promotions are always decoded as a queen, since the camera
+    can't tell the promoted pieces apart.
+
+    Parameters:
+        board: Position before the move
+        scores: 8x8 change scores from diff_scores()
+        saturation: Score from which a square is considered fully changed
+
+    Returns:
+        A tuple (move, fit, margin), where margin is the fit difference to
+        the runner-up. move is None when there are no legal moves.
+    """
+    evidence = square_evidence(scores, saturation)
+    total = evidence.sum()
+
+    ranked = []
+    for move in board.legal_moves:
+        if move.promotion not in (None, chess.QUEEN):
+            continue
+
+        squares = expected_squares(board, move)
+        matched = evidence[squares].sum()
+        fit = matched - (len(squares) - matched) - (total - matched)
+        ranked.append((fit, move))
+
+    if not ranked:
+        return None, 0.0, 0.0
+
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    best_fit, best_move = ranked[0]
+    margin = best_fit - ranked[1][0] if len(ranked) > 1 else best_fit
+
+    return best_move, float(best_fit), float(margin)
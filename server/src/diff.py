@@ -1,5 +1,13 @@
 import cv2
 import numpy as np
+from contextlib import contextmanager
+from time import perf_counter
+
+# Margins (top, bottom, left, right) cropped from the warped board to drop the red border
+CROP_MARGINS = (29, 43, 43, 43)
+
+# Threshold of the grayscale difference used by the lean path
+GRAY_THRESHOLD = 40
 
 def detect_red_regions(image):
     # Convert to HSV color space
@@ -21,6 +29,18 @@ def detect_red_regions(image):
 
     return red_mask
 
+def detect_green_regions(image):
+    """
+    Binary mask of the green stickers (the robot's pieces), like
+    detect_red_regions() does for red.
+    """
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+    lower_green = np.array([35, 60, 50])
+    upper_green = np.array([90, 255, 255])
+
+    return cv2.inRange(hsv, lower_green, upper_green)
+
 def find_largest_red_border(mask):
     # Find contours in the mask
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -81,6 +101,18 @@ def warp_perspective(image, src_points, width=800, height=800):
     Returns:
         The warped BGR image
     """
+    # Get the perspective transformation matrix
+    matrix = perspective_matrix(src_points, width, height)
+
+    # Warp the image using the matrix
+    warped = cv2.warpPerspective(image, matrix, (width, height))
+    return warped
+
+def perspective_matrix(src_points, width=800, height=800):
+    """
+    Computes the 3x3 matrix that maps 4 ordered corner points to the corners
+    of a width x height output image.
+    """
     dst_points = np.array([
         [0, 0],
         [width - 1, 0],
@@ -88,12 +120,106 @@ def warp_perspective(image, src_points, width=800, height=800):
         [0, height - 1]
     ], dtype="float32")
 
-    # Get the perspective transformation matrix
-    matrix = cv2.getPerspectiveTransform(src_points, dst_points)
+    return cv2.getPerspectiveTransform(src_points, dst_points)
 
-    # Warp the image using the matrix
-    warped = cv2.warpPerspective(image, matrix, (width, height))
-    return warped
+
+def calibrate(image, width=800, height=800):
+    """
+    Locates the red border once and stores everything diff() needs to
+    straighten later frames. The camera and the board don't move during a
+    game, so the result can be reused until has_drifted() says otherwise.
+
+    Parameters:
+        image: Original BGR frame, as delivered by the camera
+        width: Width of the warped board
+        height: Height of the warped board
+
+    Returns:
+        A dict with the perspective 'matrix', the ordered border 'corners'
+        (in the rotated frame), the output 'size' and the 'crop' margins
+    """
+    image = cv2.rotate(image, cv2.ROTATE_180)
+
+    red_mask = detect_red_regions(image)
+    corners = order_points(find_largest_red_border(red_mask))
+
+    return {
+        "matrix": perspective_matrix(corners, width, height),
+        "corners": corners,
+        "size": (width, height),
+        "crop": CROP_MARGINS,
+    }
+
+def frame_matrix(calibration, frame_shape, scale=1.0):
+    """
+    Folds the 180° rotation of the raw frame (and an optional scale of the
+    output) into the calibrated matrix, so a camera frame can be straightened
+    with a single cv2.warpPerspective call.
+
+    Parameters:
+        calibration: Result of calibrate()
+        frame_shape: Shape of the raw frame
+        scale: Factor applied to the warped board size
+
+    Returns:
+        The 3x3 matrix and the (width, height) of the output
+    """
+    height, width = frame_shape[:2]
+    rotation = np.array([
+        [-1, 0, width - 1],
+        [0, -1, height - 1],
+        [0, 0, 1]
+    ], dtype=np.float64)
+    scaling = np.diag([scale, scale, 1.0])
+
+    out_width, out_height = calibration["size"]
+    size = (max(1, int(round(out_width * scale))), max(1, int(round(out_height * scale))))
+
+    return scaling @ calibration["matrix"] @ rotation, size
+
+def board_matrix(calibration, frame_shape, resolution):
+    """
+    Single matrix that takes a raw camera frame straight to the cropped
+    board: 180° rotation, calibrated perspective, crop margins and scaling
+    to a resolution x resolution image.
+    """
+    matrix, (width, height) = frame_matrix(calibration, frame_shape)
+    top, bottom, left, right = calibration["crop"]
+
+    scale_x = resolution / (width - left - right)
+    scale_y = resolution / (height - top - bottom)
+    crop = np.array([
+        [scale_x, 0, -left * scale_x],
+        [0, scale_y, -top * scale_y],
+        [0, 0, 1]
+    ], dtype=np.float64)
+
+    return crop @ matrix
+
+def border_alignment(image, calibration, band=20):
+    """
+    Warps the red mask of a frame with the stored matrix and measures how
+    much of the outer band of the warped board is still red.
+
+    Returns:
+        Fraction (0 to 1) of the border band covered by red pixels
+    """
+    image = cv2.rotate(image, cv2.ROTATE_180)
+    red_mask = detect_red_regions(image)
+
+    width, height = calibration["size"]
+    warped = cv2.warpPerspective(red_mask, calibration["matrix"], (width, height), flags=cv2.INTER_NEAREST)
+
+    border = np.ones((height, width), dtype=bool)
+    border[band:-band, band:-band] = False
+
+    return np.count_nonzero(warped[border]) / np.count_nonzero(border)
+
+def has_drifted(image, calibration, min_alignment=0.75):
+    """
+    Tells whether the camera or the board moved since the calibration was made.
+    """
+    return border_alignment(image, calibration) < min_alignment
 
 
 def crop_red_border(image, border_size=40):
@@ -206,45 +332,165 @@ def convert_to_chess_notation(squares):
     return [to_notation(r, c) for r, c in squares]
 
 
-def diff(before, after):
-    before = cv2.rotate(before, cv2.ROTATE_180)
-    after = cv2.rotate(after, cv2.ROTATE_180)
-    
-    before_rgb = cv2.cvtColor(before, cv2.COLOR_BGR2RGB)
-    after_rgb = cv2.cvtColor(after, cv2.COLOR_BGR2RGB)
+def square_change_scores(binary_mask, margin=0.15):
+    """
+    Scores every board square in one pass by reshaping the binary mask into
+    an 8x8 grid of cells and averaging each cell. Only the inner part of the
+    cell is used, so a blob that spills over a square boundary barely counts
+    for the neighbouring square.
+
+    Parameters:
+        binary_mask: Single-channel mask of the straightened board (0 or 255)
+        margin: Fraction of the cell ignored on each side
+
+    Returns:
+        An 8x8 float array with the changed fraction (0 to 1) of each square,
+        indexed as (row, col) with (0,0) at the top-left of the board
+    """
+    height, width = binary_mask.shape[:2]
+    cell_h, cell_w = height // 8, width // 8
+
+    cells = binary_mask[:cell_h * 8, :cell_w * 8].reshape(8, cell_h, 8, cell_w)
 
-    red_mask_before = detect_red_regions(before)
-    red_mask_after = detect_red_regions(after)
+    my, mx = int(cell_h * margin), int(cell_w * margin)
+    inner = cells[:, my:cell_h - my, :, mx:cell_w - mx]
+
+    return inner.mean(axis=(1, 3)) / 255.0
+
+def get_changed_squares_from_scores(scores, min_score=0.2):
+    """
+    Picks the squares whose change score reaches min_score.
 
-    red_border_before = find_largest_red_border(red_mask_before)
-    red_border_after = find_largest_red_border(red_mask_after)
+    Returns:
+        List of (row, col) tuples, most changed first
+    """
+    rows, cols = np.nonzero(scores >= min_score)
+    order = np.argsort(-scores[rows, cols], kind="stable")
+    return [(int(rows[i]), int(cols[i])) for i in order]
 
-    ordered_pts_before = order_points(red_border_before)
-    ordered_pts_after = order_points(red_border_after)
 
-    warped_before = warp_perspective(before_rgb, ordered_pts_before, width=800, height=800)
-    warped_after = warp_perspective(after_rgb, ordered_pts_after, width=800, height=800)
+@contextmanager
+def stage(timings, name):
+    """
+    Adds the time spent inside the block to timings[name] (in seconds).
+    Does nothing when timings is None.
+    """
+    if timings is None:
+        yield
+        return
 
-    before_cropped = crop_red_border_custom(warped_before,  29, 43, 43, 43 )
-    after_cropped = crop_red_border_custom(warped_after, 29, 43, 43, 43)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + perf_counter() - start
 
-    before = before_cropped[:, :, ::-1].copy()
-    after = after_cropped[:, :, ::-1].copy()
 
-    height, width = before.shape[:2]
+def straighten_pair(before, after, calibration=None, timings=None):
+    """
+    Rotates, warps and crops both frames so that only the 64 squares remain.
 
-    cell_w = width // 8
-    cell_h = height // 8
+    When a calibration from calibrate() is given, both frames are straightened
+    with the stored matrix and the red border doesn't need to be visible.
+    Otherwise the border is detected again on each frame.
 
-    thresh = preprocess_diff(before, after)
+    Stage durations are added to the timings dict, if given.
+    """
+    with stage(timings, "rotate"):
+        before = cv2.rotate(before, cv2.ROTATE_180)
+        after = cv2.rotate(after, cv2.ROTATE_180)
 
-    thresh_gray = cv2.cvtColor(thresh, cv2.COLOR_BGR2GRAY)
+    if calibration is not None:
+        with stage(timings, "warp"):
+            width, height = calibration["size"]
+            warped_before = cv2.warpPerspective(before, calibration["matrix"], (width, height))
+            warped_after = cv2.warpPerspective(after, calibration["matrix"], (width, height))
 
-    _, contours = draw_contours(before, thresh_gray)
-    _, centers = draw_centers(before, contours)
+        with stage(timings, "crop"):
+            before = crop_red_border_custom(warped_before, *calibration["crop"])
+            after = crop_red_border_custom(warped_after, *calibration["crop"])
+    else:
+        with stage(timings, "mask"):
+            red_mask_before = detect_red_regions(before)
+            red_mask_after = detect_red_regions(after)
 
-    changed_squares = get_changed_squares(centers, cell_w, cell_h)
-    return convert_to_chess_notation(changed_squares)
+        with stage(timings, "contour"):
+            red_border_before = find_largest_red_border(red_mask_before)
+            red_border_after = find_largest_red_border(red_mask_after)
+
+            ordered_pts_before = order_points(red_border_before)
+            ordered_pts_after = order_points(red_border_after)
+
+        with stage(timings, "warp"):
+            before_rgb = cv2.cvtColor(before, cv2.COLOR_BGR2RGB)
+            after_rgb = cv2.cvtColor(after, cv2.COLOR_BGR2RGB)
+
+            warped_before = warp_perspective(before_rgb, ordered_pts_before, width=800, height=800)
+            warped_after = warp_perspective(after_rgb, ordered_pts_after, width=800, height=800)
+
+        with stage(timings, "crop"):
+            before_cropped = crop_red_border_custom(warped_before, *CROP_MARGINS)
+            after_cropped = crop_red_border_custom(warped_after, *CROP_MARGINS)
+
+            before = before_cropped[:, :, ::-1].copy()
+            after = after_cropped[:, :, ::-1].copy()
+
+    return before, after
+
+def straighten_pair_gray(before, after, calibration, resolution=400, timings=None):
+    """
+    Lean version of straighten_pair(): converts both frames to grayscale and
+    takes them to the cropped board with a single warp (see board_matrix()),
+    without any intermediate full-size copy.
+
+    Returns:
+        Two single-channel resolution x resolution images
+    """
+    with stage(timings, "gray"):
+        before = cv2.cvtColor(before, cv2.COLOR_BGR2GRAY)
+        after = cv2.cvtColor(after, cv2.COLOR_BGR2GRAY)
+
+    with stage(timings, "warp"):
+        matrix = board_matrix(calibration, before.shape, resolution)
+        before = cv2.warpPerspective(before, matrix, (resolution, resolution))
+        after = cv2.warpPerspective(after, matrix, (resolution, resolution))
+
+    return before, after
+
+def diff_scores(before, after, calibration=None, timings=None, resolution=None):
+    """
+    Returns the dense 8x8 change score matrix between two frames
+    (see square_change_scores).
+
+    With a calibration and a working resolution, the lean grayscale path
+    (straighten_pair_gray) is used. The blur and morphology kernels are
+    scaled from their 800x800 sizes to that resolution.
+    """
+    if calibration is not None and resolution is not None:
+        before, after = straighten_pair_gray(before, after, calibration, resolution, timings)
+
+        with stage(timings, "diff"):
+            blur = max(1, int(9 * resolution / 800)) | 1
+            morph = max(1, round(5 * resolution / 800))
+            thresh = preprocess_diff(before, after, blur_ksize=(blur, blur), threshold_val=GRAY_THRESHOLD,
+                                     morph_kernel_size=(morph, morph))
+    else:
+        before, after = straighten_pair(before, after, calibration, timings)
+
+        with stage(timings, "diff"):
+            thresh = preprocess_diff(before, after)
+            thresh = cv2.cvtColor(thresh, cv2.COLOR_BGR2GRAY)
+
+    with stage(timings, "score"):
+        return square_change_scores(thresh)
+
+def diff(before, after, calibration=None, timings=None, resolution=None):
+    """
+    Returns the squares (in chess notation) that changed between two frames,
+    most changed first.
+    """
+    scores = diff_scores(before, after, calibration, timings, resolution)
+    return convert_to_chess_notation(get_changed_squares_from_scores(scores))
 
 
 if __name__ == "__main__":
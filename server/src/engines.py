@@ -0,0 +1,173 @@
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
+
+import chess.engine
+
+ENGINE_ERRORS = (chess.engine.EngineError, chess.engine.EngineTerminatedError, OSError, TimeoutError)
+
+
+class EnginePool:
+    """
+    A fixed number of UCI engine processes shared by every caller.
+
+    Engines are checked out with engine() and handed back when the block
+    ends. Waiting callers are served in arrival order. An engine that fails
+    its health check on checkout, or raises an engine error while in use,
+    is closed and replaced by a fresh process.
+
+    Background work (pondering) checks out with spare=True: it only gets an
+    engine when nobody is waiting and more than reserve engines are idle,
+    so it can't keep a move search waiting.
+    """
+
+    def __init__(self, path, size=None, options=None, reserve=0):
+        self.path = path
+        self.options = options or {}
+        self.reserve = reserve
+        threads = int(self.options.get("Threads", 1))
+        self.size = size or max(1, (os.cpu_count() or 1) // threads)
+
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.waiting = deque()
+        self.closed = False
+        self.restarts = 0
+        self.in_use = 0
+
+        for _ in range(self.size):
+            self.idle.append(self._spawn())
+
+    def _spawn(self):
+        engine = chess.engine.SimpleEngine.popen_uci(self.path)
+        if self.options:
+            engine.configure(self.options)
+        return engine
+
+    def _replace(self, engine):
+        try:
+            engine.close()
+        except Exception:
+            pass
+        with self.condition:
+            self.restarts += 1
+        return self._spawn()
+
+    def _quit(self, engine):
+        try:
+            engine.quit()
+        except ENGINE_ERRORS:
+            # Already dead, e.g. killed along with the server
+            pass
+
+    def _healthy(self, engine):
+        try:
+            engine.ping()
+            return engine
+        except ENGINE_ERRORS:
+            return self._replace(engine)
+
+    def checkout(self, timeout=None, spare=False):
+        """
+        Takes an engine from the pool, waiting for one (in arrival order)
+        if all are busy. With spare, returns None straight away instead of
+        taking one of the last reserve idle engines or waiting.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        ticket = object()
+
+        with self.condition:
+            if spare:
+                if self.closed or self.waiting or len(self.idle) <= self.reserve:
+                    return None
+                engine = self.idle.popleft()
+                self.in_use += 1
+            else:
+                self.waiting.append(ticket)
+                try:
+                    while self.closed or not self.idle or self.waiting[0] is not ticket:
+                        if self.closed:
+                            raise RuntimeError("❌ Engine pool is closed.")
+                        remaining = None if deadline is None else deadline - monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise TimeoutError("❌ No engine available.")
+                        self.condition.wait(remaining)
+                    engine = self.idle.popleft()
+                    self.in_use += 1
+                finally:
+                    self.waiting.remove(ticket)
+                    self.condition.notify_all()
+        return self._checked_out(engine)
+
+    def _checked_out(self, engine):
+        try:
+            return self._healthy(engine)
+        except Exception:
+            # The replacement couldn't be started either, the pool loses a slot
+            with self.condition:
+                self.in_use -= 1
+                self.size -= 1
+                self.condition.notify_all()
+            raise
+
+    def checkin(self, engine, broken=False):
+        """
+        Gives an engine back to the pool, restarting it if it broke.
+        """
+        if broken:
+            try:
+                engine = self._replace(engine)
+            except Exception:
+                # The replacement couldn't be started, the pool loses the slot
+                with self.condition:
+                    self.in_use -= 1
+                    self.size -= 1
+                    self.condition.notify_all()
+                raise
+
+        with self.condition:
+            self.in_use -= 1
+            if self.closed:
+                self._quit(engine)
+            else:
+                self.idle.append(engine)
+            self.condition.notify_all()
+
+    @contextmanager
+    def engine(self, timeout=None, spare=False):
+        engine = self.checkout(timeout, spare)
+        if engine is None:
+            # No spare engine
+            yield None
+            return
+        broken = False
+        try:
+            yield engine
+        except ENGINE_ERRORS:
+            broken = True
+            raise
+        finally:
+            # Any other exception (a bug, KeyboardInterrupt) must not leak the slot either
+            self.checkin(engine, broken=broken)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "size": self.size,
+                "idle": len(self.idle),
+                "in_use": self.in_use,
+                "waiting": len(self.waiting),
+                "restarts": self.restarts,
+            }
+
+    def close(self):
+        """
+        Quits the idle engines now; busy ones quit when they are checked in.
+        """
+        with self.condition:
+            self.closed = True
+            while self.idle:
+                self._quit(self.idle.popleft())
+            self.condition.notify_all()
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+
+
+class StatusFeed:
+    """
+    The latest status of a session, shared by every viewer.
+
+    The producer publishes a status dict whenever something may have
+    changed; a new version is only created when the status actually differs
+    from the previous one. Any number of subscribers can wait() for a newer
+    version, and the encoded JSON is built once per version, not per viewer.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        # Tells versions of different server runs apart in ETags
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+        self.status = None
+        self.data = None
+        self.closed = False
+
+    def publish(self, status):
+        """
+        Publishes the status, returning True if it created a new version.
+        """
+        with self.condition:
+            if status == self.status:
+                return False
+            self.version += 1
+            self.status = status
+            self.data = json.dumps({**status, "version": self.version}, ensure_ascii=False)
+            self.condition.notify_all()
+            return True
+
+    def etag(self, version):
+        return f"{self.epoch}-{version}"
+
+    def latest(self):
+        """
+        Returns (version, data) for the current status.
+        """
+        with self.condition:
+            return self.version, self.data
+
+    def wait(self, version, timeout=None):
+        """
+        Waits for a version newer than the given one. Returns (version, data),
+        or None if timeout expired or the feed was closed first.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.closed or self.version > version, timeout)
+            if self.version > version:
+                return self.version, self.data
+            return None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class StreamLimit:
+    """
+    Caps the event streams open at once. Under a thread-per-connection
+    server each one holds a worker thread for as long as its viewer stays
+    connected, so without a cap a few dozen viewers would starve every
+    other request (the robot's included).
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.open = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a slot, returning False if all of them are in use.
+        """
+        with self.lock:
+            if self.open >= self.limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.open -= 1
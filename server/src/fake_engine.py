@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Stub UCI engine for load tests: answers like Stockfish, but only "thinks"
+for --latency seconds (or less if the search is stopped or its movetime is
+shorter), reporting one fake iteration every --iteration seconds. Its best
+move only settles once --latency has passed, so infinite searches stopped
+on a stable move take about that long too. The move is a random legal
+one (--seed for repeatable runs).
+
+Point the server at it with:
+    CHESSBOT_ENGINE="python3 src/fake_engine.py --latency 0.2" python3 src/main.py
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+import chess
+
+
+def send(line):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+class FakeEngine:
+    def __init__(self, latency, iteration, rng):
+        self.latency = latency
+        self.iteration = iteration
+        self.rng = rng
+        self.board = chess.Board()
+        self.multipv = 1
+        self.stopping = threading.Event()
+        self.search = None
+
+    def position(self, args):
+        if args[0] == "startpos":
+            self.board = chess.Board()
+            rest = args[1:]
+        else:
+            self.board = chess.Board(" ".join(args[1:7]))
+            rest = args[7:]
+        if rest and rest[0] == "moves":
+            for uci in rest[1:]:
+                self.board.push_uci(uci)
+
+    def go(self, args):
+        duration = self.latency
+        if "movetime" in args:
+            duration = min(duration, int(args[args.index("movetime") + 1]) / 1000)
+        if "infinite" in args:
+            duration = float("inf")
+        max_depth = int(args[args.index("depth") + 1]) if "depth" in args else 100
+
+        self.stopping.clear()
+        self.search = threading.Thread(target=self._search, args=(self.board.copy(), duration, max_depth))
+        self.search.start()
+
+    def _search(self, board, duration, max_depth):
+        moves = list(board.legal_moves)
+        self.rng.shuffle(moves)
+        start = time.monotonic()
+        depth = 0
+        while depth < max_depth and not self.stopping.wait(self.iteration):
+            elapsed = time.monotonic() - start
+            if elapsed >= duration:
+                break
+            depth += 1
+            nodes = depth * 10000
+            # The best move keeps changing until latency has passed, so
+            # callers that stop on a stable best move still wait for it
+            first = depth % len(moves) if moves and elapsed < self.latency else 0
+            for rank, move in enumerate((moves[first:] + moves[:first])[:self.multipv]):
+                send(f"info depth {depth} multipv {rank + 1} score cp {20 - rank} nodes {nodes} "
+                     f"nps {int(nodes / elapsed)} time {int(elapsed * 1000)} pv {move.uci()}")
+        send(f"bestmove {moves[0].uci() if moves else '(none)'}")
+
+    def stop(self):
+        self.stopping.set()
+        if self.search is not None:
+            self.search.join()
+            self.search = None
+
+    def run(self):
+        for line in sys.stdin:
+            args = line.split()
+            if not args:
+                continue
+            command = args[0]
+            if command == "uci":
+                send("id name FakeEngine")
+                send("option name MultiPV type spin default 1 min 1 max 500")
+                send("option name Threads type spin default 1 min 1 max 1024")
+                send("option name Hash type spin default 16 min 1 max 33554432")
+                send("uciok")
+            elif command == "isready":
+                send("readyok")
+            elif command == "setoption" and "MultiPV" in args:
+                self.multipv = int(args[-1])
+            elif command == "position":
+                self.position(args[1:])
+            elif command == "go":
+                self.go(args[1:])
+            elif command == "stop":
+                self.stop()
+            elif command == "quit":
+                self.stop()
+                break
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub UCI engine with configurable latency")
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds spent per search")
+    parser.add_argument("--iteration", type=float, default=0.01, help="Seconds between fake iterations")
+    parser.add_argument("--seed", type=int, help="Seed for the random moves")
+    args = parser.parse_args()
+
+    FakeEngine(args.latency, args.iteration, random.Random(args.seed)).run()
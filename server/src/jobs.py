@@ -0,0 +1,166 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobRefused(Exception):
+    """
+    Raised by an action that can't run in the session's current state
+    (not the robot's turn, the board changed meanwhile): the client's
+    doing, not a server fault.
+    """
+
+
+class Job:
+    """
+    One long-running action (a capture countdown, an engine move...) run in
+    the background. The action reports its progress through report() and
+    its outcome through finish(); clients read both with snapshot().
+    """
+
+    def __init__(self, kind, session_id, on_progress=None, stopping=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.session_id = session_id
+        self.state = QUEUED
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.refused = False
+        self.created = time()
+        self.finished = None
+
+        self.on_progress = on_progress
+        self.stopping = stopping or threading.Event()
+        self.condition = threading.Condition()
+
+    def report(self, progress):
+        with self.condition:
+            self.progress = progress
+            self.condition.notify_all()
+        if self.on_progress is not None:
+            self.on_progress(progress)
+
+    def sleep(self, seconds):
+        """
+        Waits between steps, giving up if the server is shutting down.
+        """
+        if self.stopping.wait(seconds):
+            raise JobCancelled()
+
+    def finish(self, result=None, error=None, refused=False):
+        """
+        Publishes the outcome. The action may keep running afterwards
+        (e.g. to reset a message), the job already counts as finished.
+        refused tells a failure from the session's state (JobRefused) apart.
+        """
+        with self.condition:
+            if self.done:
+                return
+            self.result = result
+            self.error = error
+            self.refused = refused
+            self.state = FAILED if error is not None else DONE
+            self.finished = time()
+            self.condition.notify_all()
+
+    @property
+    def done(self):
+        return self.state in (DONE, FAILED)
+
+    def wait(self, timeout=None):
+        """
+        Waits until the job finishes or timeout expires. Returns done.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.done, timeout)
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "session": self.session_id,
+                "state": self.state,
+                "progress": self.progress,
+                "result": self.result,
+                "error": self.error,
+                "refused": self.refused,
+                "created": self.created,
+                "finished": self.finished,
+            }
+
+
+class JobQueue:
+    """
+    Runs jobs on a small pool of worker threads and keeps the last `keep`
+    of them around so their results can still be read.
+    """
+
+    def __init__(self, workers=4, keep=256):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def submit(self, kind, session_id, action, on_progress=None):
+        """
+        Queues action(job) and returns the job straight away. Whatever the
+        action returns is the job's result, unless it called finish() itself.
+        """
+        job = Job(kind, session_id, on_progress, self.stopping)
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.keep:
+                oldest = next(iter(self.jobs.values()))
+                if not oldest.done:
+                    break
+                self.jobs.popitem(last=False)
+
+        self.executor.submit(self._run, job, action)
+        return job
+
+    def _run(self, job, action):
+        with job.condition:
+            job.state = RUNNING
+        try:
+            job.finish(action(job))
+        except JobCancelled:
+            job.finish(error="❌ Servidor desligando.")
+        except JobRefused as error:
+            job.finish(error=str(error), refused=True)
+        except Exception as error:
+            job.finish(error=str(error) or type(error).__name__)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        with self.lock:
+            states = [job.state for job in self.jobs.values()]
+        return {state: states.count(state) for state in (QUEUED, RUNNING, DONE, FAILED)}
+
+    def close(self):
+        """
+        Cancels the queued jobs and the ones waiting between steps, and
+        waits for the running ones.
+        """
+        self.stopping.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.finish(error="❌ Servidor desligando.")
@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+from datetime import date, datetime
+from time import sleep, time
+
+import chess
+import chess.pgn
+
+
+class GameJournal:
+    """
+    Append-only log of one table's games, one JSON record per line:
+
+        {"type": "start", "fen": ..., "time": ...}
+        {"type": "move", "move": "e2e4", "source": "vision", "confidence": {...}, "time": ...}
+        {"type": "position", "fen": ..., "moves": [...], "time": ...}   (board corrected)
+        {"type": "end", "result": "1-0", "pgn": "games/...", "time": ...}
+
+    Records are written to the OS straight away; fsync runs in the
+    background at most every sync_interval seconds, so a burst of moves
+    costs one disk sync. replay() rebuilds the game in progress after a
+    restart.
+
+    When a new game starts and the file is over max_bytes, it is renamed
+    with a timestamp, so replay only reads the recent games.
+    """
+
+    def __init__(self, path, games_dir, sync_interval=0.5, max_bytes=1 << 20):
+        self.path = path
+        self.games_dir = games_dir
+        self.sync_interval = sync_interval
+        self.max_bytes = max_bytes
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        os.makedirs(games_dir, exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+        if self.file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # Don't glue the next record to a line torn by a crash
+                    self.file.write("\n")
+        self.lock = threading.Lock()
+        self.dirty = threading.Event()
+        self.closed = False
+        self.syncs = 0
+        self.records = 0
+
+        self.thread = threading.Thread(target=self._sync_loop, name="journal", daemon=True)
+        self.thread.start()
+
+    def _append(self, record):
+        record["time"] = time()
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.closed:
+                return
+            self.file.write(line)
+            self.file.flush()
+            self.records += 1
+        self.dirty.set()
+
+    def _sync(self):
+        with self.lock:
+            if self.closed:
+                return
+            os.fsync(self.file.fileno())
+            self.syncs += 1
+
+    def _sync_loop(self):
+        while not self.closed:
+            self.dirty.wait()
+            self.dirty.clear()
+            self._sync()
+            # Records appended meanwhile wait for the next round
+            sleep(self.sync_interval)
+
+    def _rotate(self):
+        with self.lock:
+            if self.file.tell() < self.max_bytes:
+                return
+            os.fsync(self.file.fileno())
+            self.file.close()
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            root, ext = os.path.splitext(self.path)
+            os.replace(self.path, f"{root}.{stamp}{ext}")
+            self.file = open(self.path, "a", encoding="utf-8")
+
+    def start(self, board):
+        self._rotate()
+        self._append({"type": "start", "fen": board.fen()})
+
+    def move(self, move, source, confidence=None):
+        self._append({"type": "move", "move": move.uci(), "source": source, "confidence": confidence})
+
+    def position(self, board):
+        """
+        Records a board that was set rather than played into (a resync).
+        """
+        root = board.root()
+        self._append({"type": "position", "fen": root.fen(), "moves": [move.uci() for move in board.move_stack]})
+
+    def end(self, board, details):
+        """
+        Exports the finished game to PGN and records its end. Returns the
+        PGN path.
+        """
+        game = to_pgn(board, details)
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.path.splitext(os.path.basename(self.path))[0]}.pgn"
+        path = os.path.join(self.games_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(str(game) + "\n")
+        self._append({"type": "end", "result": board.result(), "pgn": path})
+        return path
+
+    def replay(self):
+        """
+        Reads the journal back. Returns (board, details) for the game in
+        progress, details being the journal record of each move on the
+        board's stack, or (None, []) if there is none (no journal, or the
+        last game ended).
+        """
+        board = None
+        details = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-write
+                    continue
+
+                kind = record.get("type")
+                if kind == "start":
+                    board, details = chess.Board(record["fen"]), []
+                elif kind == "position":
+                    board, details = chess.Board(record["fen"]), []
+                    for uci in record["moves"]:
+                        board.push_uci(uci)
+                        details.append({"source": "position"})
+                elif kind == "move" and board is not None:
+                    move = chess.Move.from_uci(record["move"])
+                    if move not in board.legal_moves:
+                        continue
+                    board.push(move)
+                    details.append(record)
+                elif kind == "end":
+                    board, details = None, []
+        return board, details
+
+    def stats(self):
+        with self.lock:
+            return {"path": self.path, "records": self.records, "syncs": self.syncs}
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            os.fsync(self.file.fileno())
+            self.closed = True
+            self.file.close()
+        self.dirty.set()
+
+
+def to_pgn(board, details=()):
+    """
+    Returns the game on the board as a chess.pgn.Game. Each move gets a
+    comment with the journal's source and confidence, for auditing the
+    move detection.
+    """
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "ChessBOT"
+    game.headers["Date"] = date.today().strftime("%Y.%m.%d")
+    game.headers["White"] = "Humano"
+    game.headers["Black"] = "ChessBOT"
+
+    for node, detail in zip(game.mainline(), details):
+        comment = detail.get("source", "")
+        confidence = detail.get("confidence")
+        if confidence:
+            comment += " " + " ".join(f"{key}={value}" for key, value in confidence.items())
+        node.comment = comment.strip()
+    return game
@@ -0,0 +1,154 @@
+"""
+HTTP load generator for the server. Robots replay the ESP32's loop
+(/reset once, then /capture-board-state, /confirm-opponent-move,
+/get-best-move) on their own table each, playing the human's move through
+/opponent-move when the camera doesn't see one (the stand-in camera never
+does), while pollers hit /status like the UI. Prints throughput, latency percentiles and errors per route.
+
+Run the server on the stand-in camera and engine, from a scratch
+directory so the position cache and the journal stay out of the way:
+
+    cd $(mktemp -d)
+    CHESSBOT_CAMERA=/path/to/server/vision \
+    CHESSBOT_ENGINE="python3 /path/to/server/src/fake_engine.py --latency 0.2" \
+    CHESSBOT_CAPTURE_COUNTDOWN=0 \
+    python3 /path/to/server/src/serve.py
+
+Usage:
+    python3 src/loadtest.py http://localhost:5000 [--robots 2] [--pollers 50] [--duration 60]
+"""
+import argparse
+import random
+import threading
+from collections import defaultdict
+from time import monotonic, perf_counter, sleep
+
+import chess
+import numpy as np
+import requests
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def request(self, http, route, url, method="GET", **kwargs):
+        start = perf_counter()
+        try:
+            response = http.request(method, url, timeout=60, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        elapsed = perf_counter() - start
+
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            if not ok:
+                self.errors[route] += 1
+        return response
+
+
+def robot(base, table, camera, recorder, deadline, game_length):
+    http = requests.Session()
+    prefix = f"{base}/sessions/{table}"
+    params = {"camera": camera} if camera else {}
+    http.post(f"{prefix}/open", params=params, timeout=60).raise_for_status()
+
+    rng = random.Random(table)
+    moves = game_length
+    while monotonic() < deadline:
+        if moves >= game_length:
+            recorder.request(http, "/reset", f"{prefix}/reset")
+            moves = 0
+        recorder.request(http, "/capture-board-state", f"{prefix}/capture-board-state")
+        response = recorder.request(http, "/confirm-opponent-move", f"{prefix}/confirm-opponent-move")
+        if response is None or not response.ok or not response.json().get("accepted"):
+            if not opponent_move(http, prefix, recorder, rng):
+                moves = game_length
+                continue
+        recorder.request(http, "/get-best-move", f"{prefix}/get-best-move")
+        moves += 1
+
+    http.get(f"{prefix}/close", timeout=60)
+
+
+def opponent_move(http, prefix, recorder, rng):
+    """
+    Plays a random legal move for the human. Returns False if the game is
+    over.
+    """
+    board = chess.Board(http.get(f"{prefix}/status", timeout=60).json()["fen"])
+    if board.is_game_over():
+        return False
+    move = rng.choice(list(board.legal_moves))
+    recorder.request(http, "/opponent-move", f"{prefix}/opponent-move", method="POST", params={"uci": move.uci()})
+    return True
+
+
+def poller(base, tables, recorder, deadline, interval, etag):
+    http = requests.Session()
+    tags = {}
+    i = 0
+    while monotonic() < deadline:
+        table = tables[i % len(tables)]
+        i += 1
+        headers = {"If-None-Match": tags[table]} if etag and table in tags else {}
+        response = recorder.request(http, "/status", f"{base}/sessions/{table}/status", headers=headers)
+        if response is not None and "ETag" in response.headers:
+            tags[table] = response.headers["ETag"]
+        sleep(interval)
+
+
+def run(base, robots, pollers, duration, camera, interval, etag, game_length):
+    recorder = Recorder()
+    tables = [f"load-{i}" for i in range(robots)] or ["default"]
+    start = monotonic()
+    deadline = start + duration
+
+    robot_threads = [threading.Thread(target=robot, args=(base, table, camera, recorder, deadline, game_length))
+                     for table in tables[:robots]]
+    poller_threads = [threading.Thread(target=poller, args=(base, tables, recorder, deadline, interval, etag))
+                      for _ in range(pollers)]
+
+    for thread in robot_threads:
+        thread.start()
+    # Let the robots open their tables before polling them
+    sleep(1.0)
+    for thread in poller_threads:
+        thread.start()
+    for thread in robot_threads + poller_threads:
+        thread.join()
+
+    return recorder, monotonic() - start
+
+
+def report(recorder, elapsed):
+    print(f"{'route':<24}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}")
+    for route, latencies in sorted(recorder.latencies.items()):
+        ms = np.array(latencies) * 1000
+        print(f"{route:<24}{len(ms):>9}{recorder.errors[route]:>8}{len(ms) / elapsed:>8.1f}"
+              f"{np.percentile(ms, 50):>10.1f}{np.percentile(ms, 95):>10.1f}"
+              f"{np.percentile(ms, 99):>10.1f}{ms.max():>10.1f}")
+
+    total = sum(len(latencies) for latencies in recorder.latencies.values())
+    errors = sum(recorder.errors.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), "
+          f"{errors} errors ({100 * errors / max(total, 1):.2f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the ChessBot server")
+    parser.add_argument("url", nargs="?", default="http://localhost:5000", help="Server address")
+    parser.add_argument("--robots", type=int, default=1, help="Tables running the ESP32 sequence")
+    parser.add_argument("--pollers", type=int, default=20, help="Clients polling /status")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--camera", default="", help="Camera for the robots' tables: device index or name in camera.json (default: the server's)")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls of each poller")
+    parser.add_argument("--etag", action="store_true", help="Poll with If-None-Match")
+    parser.add_argument("--game-length", type=int, default=20, help="Robot moves before a /reset")
+    args = parser.parse_args()
+
+    report(*run(args.url.rstrip("/"), args.robots, args.pollers, args.duration, args.camera,
+                 args.poll_interval, args.etag, args.game_length))
@@ -1,34 +1,97 @@
-from flask import Flask, Response, jsonify
-import cv2
+from flask import Flask, Response, jsonify, request, g, abort
+import os
+import shlex
+import threading
 import chess
 import chess.engine
-from diff import diff
+from diff import diff_scores, calibrate, has_drifted
+from decoder import decode_move, square_evidence
 from flask_cors import CORS 
-from time import sleep
-
-
-CAMERA_INDEX=2
-STOCKFISH_PATH="/usr/bin/stockfish"
-DEPTH=30
-LIMIT=0.1 # 1s
+from time import time, perf_counter, monotonic
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+import metrics
+from occupancy import classify_squares, mismatches, resync
+from engines import EnginePool
+from sessions import SessionRegistry, GameSession
+from camera import load_settings
+from position_cache import MATE_SCORE, PositionCache
+from book import OpeningBook
+from timeman import TimeManager
+from jobs import JobQueue, JobRefused
+from journal import GameJournal, to_pgn
+from events import StreamLimit
+from arm import ArmPlanner, load_calibration
+from robot_link import RobotLink
+
+
+CAMERA_SETTINGS=os.environ.get("CHESSBOT_CAMERA_SETTINGS", "camera.json") # Formato, resolução, exposição...
+# CHESSBOT_CAMERA (índice, imagem/pasta ou vídeo para replay) tem prioridade sobre o arquivo
+CAMERA=os.environ.get("CHESSBOT_CAMERA") or load_settings(CAMERA_SETTINGS) or 2
+# Outras mesas só abrem um índice de dispositivo ou uma câmera com nome em "cameras" do camera.json
+CAMERAS=(load_settings(CAMERA_SETTINGS) or {}).get("cameras", {})
+DEFAULT_SESSION="default"
+SESSION_IDLE_TIMEOUT=3600 # 1h
+STOCKFISH_PATH=os.environ.get("CHESSBOT_ENGINE", "/usr/bin/stockfish") # Pode ter argumentos
+TURN_TIME=3.0 # Tempo total desejado por jogada do robô (busca + braço), em segundos
+ARM_TIME=2.0 # Estimativa do tempo do braço para executar a jogada
+MAX_SEARCH_TIME=3.0
+MAX_DEPTH=30
+MIN_DEPTH=8 # Profundidade mínima antes de parar por jogada estável, e para reusar o cache
+ENGINE_POOL_SIZE=2
+ENGINE_RESERVE=1 # Engines que o ponder nunca usa, livres para as buscas de jogada
+ENGINE_OPTIONS={"Threads": 1, "Hash": 64}
+POSITION_CACHE_PATH="positions.db"
+JOURNAL_DIR="journal" # Registro das jogadas de cada mesa
+GAMES_DIR="games" # PGN das partidas terminadas
+OPENING_BOOK_PATH="book.bin" # Livro Polyglot opcional
+BOOK_MAX_PLY=16
+ARM_CALIBRATION_PATH=os.environ.get("CHESSBOT_ARM_CALIBRATION", "../hardware/lib/board/board.hpp") # Posições dos servos de cada casa
+ARM_SPEED=1.0 # µs por ms, velocidade máxima dos servos no plano do braço
+MAX_PLAN_STEPS=64 # Passos que o firmware guarda por plano (MAX_PLAN_STEPS em hardware/src/main.cpp)
+DIFF_RESOLUTION=400
+MIN_MOVE_FIT=1.0
+MIN_MOVE_MARGIN=1.0
+EVENTS_KEEPALIVE=15 # s
+EVENTS_CHECK_INTERVAL=1 # s entre verificações de cliente desconectado
+MAX_EVENT_STREAMS=8 # Conexões /events ao mesmo tempo; além disso, 503 e a página consulta /status
+ARTIFACT_QUALITY=80 # Qualidade JPEG padrão das imagens de depuração
+CAPTURE_COUNTDOWN=int(os.environ.get("CHESSBOT_CAPTURE_COUNTDOWN", 5)) # s
+MOVE_MESSAGE_TIME=2 # s
+ROBOT_COLOR=chess.BLACK # O robô joga de pretas; o humano, de brancas
+ROBOT_PORT=int(os.environ.get("CHESSBOT_ROBOT_PORT", 5001)) # Conexão persistente com os robôs (TCP)
+ROBOT_RETRY_INTERVAL=1.0 # s sem confirmação antes de reenviar uma mensagem
+ROBOT_MAX_RETRIES=5
+ROBOT_PLAY_TIMEOUT=30 # s de espera pelo fim de uma jogada, além da duração do plano
+JOB_WORKERS=4
+MAX_JOB_WAIT=30 # s, limite do long-poll
+READY_TIMEOUT=10 # s
+READY_MAX_FRAME_AGE=2 # s
 
 
 app = Flask(__name__)
 CORS(app)
-board = chess.Board()
-engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
-cap = cv2.VideoCapture(CAMERA_INDEX)
-img1 = None
-img2 = None
-message = "🤖 Olá! Sou seu adversário de xadrez robótico. Estou online e pronto para jogar!"
-
-
-def is_standard_move(changed):
-    return len(changed) == 2
-
-
-def is_castling(changed):
-    return len(changed) == 4
+engines = EnginePool(shlex.split(STOCKFISH_PATH), ENGINE_POOL_SIZE, ENGINE_OPTIONS, ENGINE_RESERVE)
+position_cache = PositionCache(POSITION_CACHE_PATH)
+event_streams = StreamLimit(MAX_EVENT_STREAMS)
+book = OpeningBook(OPENING_BOOK_PATH, BOOK_MAX_PLY)
+arm_calibration = load_calibration(ARM_CALIBRATION_PATH)
+arm = ArmPlanner(arm_calibration, ARM_SPEED) if arm_calibration is not None else None
+timeman = TimeManager(TURN_TIME, ARM_TIME, max_time=MAX_SEARCH_TIME, max_depth=MAX_DEPTH, min_depth=MIN_DEPTH)
+jobs = JobQueue(JOB_WORKERS)
+ready = threading.Event()
+closed = threading.Event()
+shutdown_lock = threading.Lock()
+
+def open_table(session_id, camera):
+    journal = GameJournal(os.path.join(JOURNAL_DIR, f"{session_id}.jsonl"), GAMES_DIR)
+    return GameSession(session_id, camera, engines, lambda session, frame: on_board_settled(session, frame), journal)
+
+sessions = SessionRegistry(
+    open_table,
+    idle_timeout=SESSION_IDLE_TIMEOUT,
+    pinned=[DEFAULT_SESSION],
+)
+sessions.open(DEFAULT_SESSION, CAMERA)
 
 
 def square_to_matrix_coords(square):
@@ -40,111 +103,352 @@ def square_to_matrix_coords(square):
 
     return (row, abs(col - 7))
 
-def get_latest_frame(cap, discard=10):
-    for _ in range(discard):
-        cap.read()
-    ret, frame = cap.read()
-    return ret, frame
-
-
-@app.route("/reset", methods=["GET"])
-def reset_board():
-    global board, message
-    message = "♻️ Perfeito! Reiniciei minha mente. Organize as peças na posição inicial e vamos começar uma nova batalha!"
-    board = chess.Board()
-    return f"<pre>{board}</pre>", 200
-
-@app.route("/view", methods=["GET"])
-def view():
-    return f"<pre>{board}</pre>", 200
-
-@app.route("/capture-board-state", methods=["GET"])
-def capture_board_state():
-    global img1, message
-    message = "📸 Preparando meus sensores visuais para capturar o tabuleiro em 5 segundos..."
-    for i in range(5):
-        message = f"📸 Focalizando minha câmera... {4-i} segundos restantes!"
-        sleep(1)
-    message = "✅ Imagem capturada com sucesso! Agora faça seu movimento!"
-    _, img1 = get_latest_frame(cap)
-    ret, buffer = cv2.imencode('.jpg', img1)
-
-    return Response(buffer.tobytes(), mimetype='image/jpeg')
-
-@app.route("/confirm-opponent-move", methods=["GET"])
-def confirm_opponent_move():
-    global img2, board, message
-    _, img2 = get_latest_frame(cap)
-    ret, buffer = cv2.imencode('.jpg', img2)
-
-    message = "🔍 Analisando seu movimento com meus algoritmos de visão computacional..."
-
-    changed = diff(img1, img2)
+def get_latest_frame(session, timeout=1.0):
+    # Waits for a frame captured after the call, so it shows the board as it is now
+    with metrics.FRAME_GRAB_SECONDS.time():
+        _, frame = session.grabber.newer_than(time(), timeout)
+    return frame is not None, frame
 
-    if is_standard_move(changed):
-        square1 = chess.parse_square(changed[0])
-        square2 = chess.parse_square(changed[1])
-
-        piece1 = board.piece_at(square1)
-        piece2 = board.piece_at(square2)
-
-        move = ""
-        captured = False
-
-        if piece1 != None and piece1.color == chess.WHITE:
-            move = f"{changed[0]}{changed[1]}"
-            captured = piece2 != None
-
-        if piece2 != None and piece2.color == chess.WHITE:
-            move = f"{changed[1]}{changed[0]}"
-            captured = piece1 != None
-        
-        move = chess.Move.from_uci(move)
-        print(captured)
-
-        if move in board.legal_moves:
-            board.push(move)
-            if captured:
-                message = "⚔️ Movimento confirmado! Vejo que capturou uma de minhas peças... Interessante estratégia!"
+def refresh_calibration(session, frame):
+    if session.calibration is not None and not has_drifted(frame, session.calibration):
+        return session.calibration
+    try:
+        session.calibration = calibrate(frame)
+    except Exception as e:
+        # Keep the previous calibration (if any) when the border is hidden
+        print(e)
+    return session.calibration
+
+def get_session(session_id):
+    session = sessions.get(session_id)
+    if session is None:
+        abort(404)
+    return session
+
+def session_route(rule, **options):
+    """
+    Registers a route for the default table (rule) and for any session
+    (/sessions/<session_id>rule).
+    """
+    def decorator(view):
+        app.route(rule, defaults={"session_id": DEFAULT_SESSION}, **options)(view)
+        app.route(f"/sessions/<session_id>{rule}", **options)(view)
+        return view
+    return decorator
+
+
+@app.before_request
+def start_timer():
+    g.start = perf_counter()
+
+@app.after_request
+def record_duration(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unknown"
+    metrics.ROUTE_SECONDS.labels(route=route).observe(perf_counter() - g.start)
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+@app.route("/sessions", methods=["GET"])
+def list_sessions():
+    return jsonify(sessions.list()), 200
+
+@app.route("/sessions/<session_id>/open", methods=["POST"])
+def open_session(session_id):
+    # Nunca um caminho, URL ou pipeline vindo da rede direto para o OpenCV
+    camera = request.args.get("camera")
+    if camera is None:
+        camera = CAMERA
+    elif camera.isdigit():
+        camera = int(camera)
+    elif camera in CAMERAS:
+        camera = CAMERAS[camera]
+    else:
+        return jsonify({"error": f"❌ Câmera desconhecida: use um índice ou um nome de {CAMERA_SETTINGS}."}), 400
+    session = sessions.open(session_id, camera)
+    return jsonify({"id": session.id, "camera": session.camera}), 200
+
+@app.route("/sessions/<session_id>/close", methods=["GET"])
+def close_session(session_id):
+    if session_id == DEFAULT_SESSION or not sessions.close(session_id):
+        abort(404)
+    return jsonify({"id": session_id}), 200
+
+def reset_action(session):
+    session.watcher.stop()
+    session.ponderer.stop()
+    with session.lock:
+        session.new_game()
+        session.message = "♻️ Perfeito! Reiniciei minha mente. Organize as peças na posição inicial e vamos começar uma nova batalha!"
+        session.calibration = None
+        return {"ply": session.board.ply()}
+
+@session_route("/reset", methods=["GET"])
+def reset_board(session_id):
+    session = get_session(session_id)
+    reset_action(session)
+    with session.lock:
+        return f"<pre>{session.board}</pre>", 200
+
+@session_route("/calibrate", methods=["GET"])
+def calibrate_board(session_id):
+    session = get_session(session_id)
+    _, frame = get_latest_frame(session)
+    try:
+        calibration = calibrate(frame)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 422
+
+    with session.lock:
+        session.calibration = calibration
+    return jsonify({"corners": calibration["corners"].tolist()}), 200
+
+@session_route("/view", methods=["GET"])
+def view(session_id):
+    session = get_session(session_id)
+    with session.lock:
+        return f"<pre>{session.board}</pre>", 200
+
+@session_route("/game.pgn", methods=["GET"])
+def game_pgn(session_id):
+    session = get_session(session_id)
+    with session.lock:
+        game = to_pgn(session.board, session.moves)
+    return Response(str(game) + "\n", mimetype="application/x-chess-pgn")
+
+def capture_action(session, job):
+    job.report(f"📸 Preparando meus sensores visuais para capturar o tabuleiro em {CAPTURE_COUNTDOWN} segundos...")
+    for i in range(CAPTURE_COUNTDOWN):
+        job.report(f"📸 Focalizando minha câmera... {CAPTURE_COUNTDOWN-1-i} segundos restantes!")
+        job.sleep(1)
+
+    _, img1 = get_latest_frame(session)
+    with session.lock:
+        session.img1 = img1
+        session.artifacts.put(session.board.ply(), "before", img1)
+        refresh_calibration(session, img1)
+        job.report("✅ Imagem capturada com sucesso! Agora faça seu movimento!")
+        return {"captured": True, "calibrated": session.calibration is not None, "ply": session.board.ply()}
+
+@session_route("/capture-board-state", methods=["GET"])
+def capture_board_state(session_id):
+    # Síncrono, para o firmware atual; /jobs/capture-board-state não bloqueia
+    session = get_session(session_id)
+    job = submit_job("capture-board-state", session, capture_action)
+    job.wait()
+    if job.error is not None:
+        # Recusado pelo estado da partida (não é a minha vez...) é erro do cliente
+        return jsonify(job.snapshot()), 409 if job.refused else 500
+    return artifact_response(session, job.result["ply"], "before", job.result)
+
+def confirm_action(session):
+    _, img2 = get_latest_frame(session)
+
+    with session.lock:
+        ply = session.board.ply()
+        session.img2 = img2
+        accepted = process_opponent_move(session)
+    return {"accepted": accepted, "ply": ply}
+
+@session_route("/confirm-opponent-move", methods=["GET"])
+def confirm_opponent_move(session_id):
+    session = get_session(session_id)
+    result = confirm_action(session)
+    return artifact_response(session, result["ply"], "after", result)
+
+@session_route("/opponent-move", methods=["POST"])
+def manual_opponent_move(session_id):
+    # Jogada do humano informada à mão (?uci=e2e4), quando a câmera não a reconhece
+    session = get_session(session_id)
+    try:
+        move = chess.Move.from_uci(request.args.get("uci", ""))
+    except ValueError:
+        return jsonify({"error": "❌ Jogada inválida: use a notação UCI, como e2e4."}), 400
+
+    with session.lock:
+        board = session.board
+        if session.robot_move is not None or board.turn == ROBOT_COLOR:
+            return jsonify({"error": "❌ Agora é a minha vez de jogar!"}), 409
+        if move not in board.legal_moves:
+            return jsonify({"error": f"❌ {move.uci()} não é uma jogada legal nesta posição."}), 400
+        ply = board.ply()
+        session.push(move, "manual")
+        session.message = "✍️ Jogada registrada manualmente! Estou processando minha resposta..."
+        return jsonify({"accepted": True, "ply": ply, "move": move.uci()}), 200
+
+def artifact_response(session, ply, kind, result):
+    # A imagem só é codificada se pedida (?image=1); o ESP32 só olha o código HTTP
+    if not request.args.get("image", type=int):
+        return jsonify(result), 200
+    return artifact(session.id, ply, kind)
+
+@session_route("/artifacts", methods=["GET"])
+def list_artifacts(session_id):
+    session = get_session(session_id)
+    return jsonify(session.artifacts.available()), 200
+
+@session_route("/artifacts/<int:ply>/<kind>.jpg", methods=["GET"])
+def artifact(session_id, ply, kind):
+    session = get_session(session_id)
+    quality = min(max(request.args.get("quality", ARTIFACT_QUALITY, type=int), 1), 100)
+    width = request.args.get("width")
+    if width is not None and not (width.isdigit() and int(width) >= 1):
+        return jsonify({"error": "❌ A largura (width) precisa ser um número inteiro maior que zero."}), 400
+    data = session.artifacts.jpeg(ply, kind, quality, int(width) if width else None)
+    if data is None:
+        abort(404)
+    return Response(data, mimetype="image/jpeg")
+
+def process_opponent_move(session):
+    # Called with session.lock held
+    board = session.board
+    if session.robot_move is not None:
+        # O braço ainda está no tabuleiro: o que a câmera vê é a minha jogada
+        session.message = "⏳ Espere meu braço terminar a jogada!"
+        return False
+    if board.turn == ROBOT_COLOR:
+        # Jogada do humano já registrada: decodificar agora acharia uma jogada das pretas
+        session.message = "❌ Agora é a minha vez de jogar!"
+        return False
+    session.message = "🔍 Analisando seu movimento com meus algoritmos de visão computacional..."
+
+    timings = {}
+    scores = diff_scores(session.img1, session.img2, session.calibration, timings, DIFF_RESOLUTION)
+    metrics.observe_stages(timings)
+    move, fit, margin = decode_move(board, scores)
+    session.artifacts.put(board.ply(), "after", session.img2, scores=scores, calibration=session.calibration)
+    accepted = False
+
+    if move is not None and fit >= MIN_MOVE_FIT and margin >= MIN_MOVE_MARGIN:
+        if board.is_castling(move):
+            if board.is_kingside_castling(move):
+                message = "🏰 Ah, um roque pequeno! Boa jogada defensiva..."
             else:
-                message = "✅ Movimento válido registrado! Estou processando minha resposta..."
-        else:
-            message = "❌ Ops! Detectei um movimento inválido. Verifique as regras e tente novamente!"
-    
-    elif is_castling(changed):
-        move  = ""
-        if "a1" in changed:
-            # Roque grande
-            move = "e1c1"
-            message = "🏰 Detectei um roque grande! Movimento clássico de proteção do rei..."
-            
-        if "h1" in changed:
-            # Roque pequeno
-            move = "e1g1"
-            message = "🏰 Ah, um roque pequeno! Boa jogada defensiva..."
-
-        move = chess.Move.from_uci(move)
-
-        if move in board.legal_moves:
-            board.push(move)
+                message = "🏰 Detectei um roque grande! Movimento clássico de proteção do rei..."
             message += " Movimento confirmado!"
+        elif move.promotion:
+            message = "👑 Promoção confirmada! Seu peão virou uma dama..."
+        elif board.is_capture(move):
+            message = "⚔️ Movimento confirmado! Vejo que capturou uma de minhas peças... Interessante estratégia!"
         else:
-            message = "❌ Roque inválido! Verifique se as condições estão corretas!"
+            message = "✅ Movimento válido registrado! Estou processando minha resposta..."
+        session.push(move, "vision", {"fit": round(float(fit), 2), "margin": round(float(margin), 2)})
+        accepted = True
+    elif move is not None and fit < MIN_MOVE_FIT and square_evidence(scores).sum() >= 2:
+        message = "❌ Ops! Detectei um movimento inválido. Verifique as regras e tente novamente!"
+        metrics.ILLEGAL_MOVES.inc()
     else:
         message = "🤔 Hmm, não consegui identificar claramente seu movimento. Pode tentar novamente?"
+        metrics.UNRECOGNISED_MOVES.inc()
 
+    session.message = message
     print(board)
-    print(changed)
-
-    return Response(buffer.tobytes(), mimetype='image/jpeg')
-
-@app.route("/get-best-move", methods=["GET"])
-def get_best_move():
-    global message
-    message = "🧠 Ativando meus circuitos de inteligência artificial... Calculando a melhor jogada!"
-    
-    result = engine.play(board, chess.engine.Limit(time=LIMIT, depth=DEPTH))
-    move = result.move
+    print(move, fit, margin)
+
+    return accepted
+
+def on_board_settled(session, frame):
+    with session.lock:
+        session.img2 = frame
+        accepted = process_opponent_move(session)
+    if accepted and robot_link.connected(session.id):
+        # Com um robô conectado, o servidor responde sem esperar o ESP32 pedir
+        submit_job("play", session, play_action)
+    return accepted
+
+@session_route("/watch", methods=["GET"])
+def watch_opponent_move(session_id):
+    session = get_session(session_id)
+    _, img1 = get_latest_frame(session)
+    with session.lock:
+        session.img1 = img1
+        session.artifacts.put(session.board.ply(), "before", img1)
+        refresh_calibration(session, img1)
+        session.watcher.start(img1, session.calibration)
+        session.message = "👀 Estou de olho no tabuleiro! Faça seu movimento quando quiser."
+    return jsonify(session.watcher.status()), 200
+
+@session_route("/watch/stop", methods=["GET"])
+def stop_watching(session_id):
+    session = get_session(session_id)
+    session.watcher.stop()
+    return jsonify(session.watcher.status()), 200
+
+@session_route("/watch/status", methods=["GET"])
+def watch_status(session_id):
+    session = get_session(session_id)
+    return jsonify(session.watcher.status()), 200
+
+def search_stats(depth=0, nodes=0, nps=0, time=0.0, score=None):
+    # Same shape as timeman.search()'s stats, for moves that needed no search
+    return {"depth": depth, "nodes": nodes, "nps": nps, "time": round(time, 3), "budget": 0.0, "score": score, "stop": None}
+
+def choose_move(session, board):
+    """
+    Book, pondered result, position cache or engine search, in this order.
+    Runs without session.lock (board is a copy): the search takes seconds.
+    search always has the keys of timeman.search()'s stats, zeroed for book
+    moves; score is in centipawns for the side to move.
+    """
+    move = book.choose(board)
+    source = "book"
+    pondered = session.ponderer.lookup(board) if move is None else None
+    cached = position_cache.lookup(board, MIN_DEPTH) if move is None and pondered is None else None
+    search = search_stats()
+
+    if move is not None:
+        metrics.BOOK_HITS.inc()
+    elif pondered is not None:
+        metrics.PONDER_HITS.inc()
+        source = "ponder"
+        move = pondered["move"]
+        score = pondered["score"].pov(board.turn).score(mate_score=MATE_SCORE) if pondered["score"] is not None else None
+        search = search_stats(pondered["depth"], pondered["nodes"], pondered["nps"], pondered["time"], score)
+        position_cache.store(board, move, pondered["score"], pondered["depth"], pondered["time"],
+                             pondered["nodes"], pondered["nps"])
+    elif cached is not None:
+        metrics.POSITION_CACHE_HITS.inc()
+        source = "cache"
+        move = cached["move"]
+        # The cache keeps White's point of view
+        score = cached["score"] if cached["score"] is None or board.turn == chess.WHITE else -cached["score"]
+        search = search_stats(cached["depth"], cached["nodes"], cached["nps"], cached["time"], score)
+    else:
+        source = "engine"
+        with engines.engine() as engine, metrics.ENGINE_PLAY_SECONDS.time():
+            move, search = timeman.search(engine, board)
+        metrics.ENGINE_NODES.observe(search["nodes"])
+        metrics.ENGINE_DEPTH.observe(search["depth"])
+        score = chess.engine.PovScore(chess.engine.Cp(search["score"]), board.turn) if search["score"] is not None else None
+        position_cache.store(board, move, score, search["depth"], search["time"], search["nodes"], search["nps"])
+    return move, source, search
+
+def board_changed(session, board):
+    # Reset ou resync desde que a jogada foi escolhida: ela não vale mais
+    return session.board.ply() != board.ply() or session.board.fen() != board.fen()
+
+def plan_move(session, job):
+    """
+    Chooses the robot's move without playing it. Returns (board, move,
+    source, result): the position it was chosen for, and what the robot
+    needs to play it.
+    """
+    job.report("🧠 Ativando meus circuitos de inteligência artificial... Calculando a melhor jogada!")
+    session.ponderer.stop()
+
+    with session.lock:
+        if session.robot_move is not None:
+            raise JobRefused("❌ O braço ainda está fazendo a jogada anterior!")
+        if session.board.turn != ROBOT_COLOR:
+            raise JobRefused("❌ Ainda não é a minha vez: faça a sua jogada primeiro!")
+        board = session.board.copy()
+    move, source, search = choose_move(session, board)
+
+    with session.lock:
+        if board_changed(session, board):
+            raise JobRefused("❌ O tabuleiro mudou enquanto eu pensava. Peça a jogada de novo!")
 
     origin = square_to_matrix_coords(move.from_square)
     destiny = square_to_matrix_coords(move.to_square)
@@ -158,80 +462,348 @@ def get_best_move():
     if board.is_castling(move):
         if move.to_square > move.from_square:
             castling_type = 1 # Roque pequeno
-            message = "🏰 Decidi fazer um roque pequeno! Protegendo meu rei e ativando a torre!"
         else:
             castling_type = 2 # Roque Grande
-            message = "🏰 Vou fazer um roque grande! Uma jogada estratégica para controlar o centro!"
-    elif piece != None:
-        message = "⚔️ Capturei sua peça! Meus cálculos indicaram que essa era a melhor opção!"
-    else:
-        message = "♟️ Executei meu movimento! Vamos ver como você responde a isso..."
-
-    board.push(move)
-    print(board)
-    
-    # Verificar situações especiais do jogo
-    if board.is_check():
-        if board.turn == chess.WHITE:
-            message += " 👑 E isso é XEQUE ao seu rei! Cuidado!"
-        else:
-            message += " 😅 Ops, parece que deixei meu rei em xeque..."
-    
-    if board.is_checkmate():
-        if board.turn == chess.WHITE:
-            message = "🎉 XEQUE-MATE! Vitória dos meus algoritmos! Boa partida, humano!"
-        else:
-            message = "😔 Você me derrotou... Meus parabéns! Vou aprender com essa derrota."
-    
-    if board.is_stalemate():
-        message = "🤝 Empate por afogamento! Uma partida equilibrada entre homem e máquina!"
 
-    sleep(2)
+    # Planned before the push, while the board still shows the captured piece
+    plan = arm.plan(board, move) if arm is not None else None
+    if plan is not None and len(plan["steps"]) > MAX_PLAN_STEPS:
+        # Sem plano, o firmware faz a jogada com os próprios movimentos
+        print(f"⚠️ Plano do braço com {len(plan['steps'])} passos, acima de {MAX_PLAN_STEPS}: enviando sem plano")
+        plan = None
 
-    message = "Agora confirme a minha jogada! Ajuste o posicionamento da peça se necessário!"
-
-    return jsonify({
+    result = {
         "from": origin,
         "to": destiny,
         "captured": piece != None,
         "castling": castling_type,
-    }), 200
-
+        "plan": plan,
+        "source": source,
+        "search": search,
+    }
+    return board, move, source, result
+
+def commit_move(session, job, board, move, source):
+    """
+    Plays the robot's move on the session's board, if it still is the
+    position the move was chosen for, and tells the player about it.
+    """
+    with session.lock:
+        if board_changed(session, board):
+            raise JobRefused("❌ O tabuleiro mudou antes da minha jogada. Confira as peças!")
+        board = session.board
+
+        if board.is_castling(move):
+            if move.to_square > move.from_square:
+                message = "🏰 Decidi fazer um roque pequeno! Protegendo meu rei e ativando a torre!"
+            else:
+                message = "🏰 Vou fazer um roque grande! Uma jogada estratégica para controlar o centro!"
+        elif board.piece_at(move.to_square) != None:
+            message = "⚔️ Capturei sua peça! Meus cálculos indicaram que essa era a melhor opção!"
+        else:
+            message = "♟️ Executei meu movimento! Vamos ver como você responde a isso..."
 
-@app.route("/status", methods=["GET"])
-def status():
-    global board, message
-    
-    # Mensagens dinâmicas baseadas no estado do jogo
-    game_status = ""
-    if board.is_game_over():
+        session.push(move, source)
+        session.ponderer.start(board)
+        print(board)
+        
+        # Verificar situações especiais do jogo
+        if board.is_check():
+            if board.turn == chess.WHITE:
+                message += " 👑 E isso é XEQUE ao seu rei! Cuidado!"
+            else:
+                message += " 😅 Ops, parece que deixei meu rei em xeque..."
+        
         if board.is_checkmate():
-            game_status = " | 🏁 Jogo finalizado!"
-        elif board.is_stalemate():
-            game_status = " | 🤝 Empate!"
-    elif board.is_check():
-        game_status = " | ⚠️ Rei em xeque!"
-    
-    return jsonify({
-        "fen": board.fen(),
-        "message": message + game_status,
-        "turn": "Sua vez" if board.turn == chess.WHITE else "Minha vez",
-        "move_count": board.fullmove_number
-    }), 200
+            if board.turn == chess.WHITE:
+                message = "🎉 XEQUE-MATE! Vitória dos meus algoritmos! Boa partida, humano!"
+            else:
+                message = "😔 Você me derrotou... Meus parabéns! Vou aprender com essa derrota."
+        
+        if board.is_stalemate():
+            message = "🤝 Empate por afogamento! Uma partida equilibrada entre homem e máquina!"
+
+        job.report(message)
+
+def best_move_action(session, job):
+    board, move, source, result = plan_move(session, job)
+    # O robô pediu a jogada e vai executá-la com o resultado
+    commit_move(session, job, board, move, source)
+    job.finish(result)
+
+    # O resultado já foi entregue; a mensagem muda depois, enquanto o braço se move
+    job.sleep(MOVE_MESSAGE_TIME)
+    job.report("Agora confirme a minha jogada! Ajuste o posicionamento da peça se necessário!")
+
+@session_route("/get-best-move", methods=["GET"])
+def get_best_move(session_id):
+    # Síncrono, para o firmware atual; /jobs/get-best-move não bloqueia
+    session = get_session(session_id)
+    job = submit_job("get-best-move", session, best_move_action)
+    job.wait()
+    if job.error is not None:
+        # Recusado pelo estado da partida (não é a minha vez...) é erro do cliente
+        return jsonify(job.snapshot()), 409 if job.refused else 500
+    return jsonify(job.result), 200
+
+def play_action(session, job):
+    board, move, source, result = plan_move(session, job)
+    with session.lock:
+        if session.robot_move is not None:
+            raise JobRefused("❌ O braço ainda está fazendo a jogada anterior!")
+        if board_changed(session, board):
+            raise JobRefused("❌ O tabuleiro mudou enquanto eu pensava. Peça a jogada de novo!")
+        session.robot_move = move
 
+    try:
+        # Manda o plano ao robô pela conexão persistente; a jogada só entra no
+        # tabuleiro quando ele avisar que terminou
+        job.report("🦾 Movendo meu braço robótico...")
+        command = robot_link.command(session.id, "play", result)
+        plan_time = result["plan"]["ms"] / 1000 if result["plan"] is not None else 0
+        if not command.wait(plan_time + ROBOT_PLAY_TIMEOUT):
+            message = "❌ O robô não avisou que terminou a jogada. Confira o tabuleiro!"
+        elif not command.ok:
+            message = f"❌ O robô não fez a minha jogada ({command.error}). Peça a jogada de novo!"
+        else:
+            message = None
+        if message is not None:
+            job.report(message)
+            raise RuntimeError(message)
+        commit_move(session, job, board, move, source)
+    finally:
+        with session.lock:
+            session.robot_move = None
+
+    result["command"] = command.seq
+    job.finish(result)
+
+    job.sleep(MOVE_MESSAGE_TIME)
+    job.report("Agora confirme a minha jogada! Ajuste o posicionamento da peça se necessário!")
+
+JOB_ACTIONS = {
+    "capture-board-state": capture_action,
+    "get-best-move": best_move_action,
+    "play": play_action,
+}
+
+def submit_job(kind, session, action):
+    def report(progress):
+        session.message = progress
+    return jobs.submit(kind, session.id, lambda job: action(session, job), on_progress=report)
+
+@session_route("/jobs/<kind>", methods=["POST"])
+def start_job(session_id, kind):
+    session = get_session(session_id)
+    if kind not in JOB_ACTIONS:
+        abort(404)
+    if kind == "play" and not robot_link.connected(session.id):
+        return jsonify({"error": "❌ Nenhum robô conectado a esta mesa."}), 409
+    job = submit_job(kind, session, JOB_ACTIONS[kind])
+    return jsonify(job.snapshot()), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    # ?wait=N: long-poll, espera até N segundos pelo fim do job
+    wait = min(request.args.get("wait", 0, type=float), MAX_JOB_WAIT)
+    if wait > 0:
+        job.wait(wait)
+    return jsonify(job.snapshot()), 200
+
+@app.route("/jobs", methods=["GET"])
+def job_stats():
+    return jsonify(jobs.stats()), 200
+
+
+def run_job(kind, session):
+    job = submit_job(kind, session, JOB_ACTIONS[kind])
+    job.wait()
+    if job.error is not None:
+        raise RuntimeError(job.error)
+    return job.result
+
+ROBOT_ACTIONS = {
+    "reset": reset_action,
+    "capture-board-state": lambda session: run_job("capture-board-state", session),
+    "confirm-opponent-move": confirm_action,
+    "get-best-move": lambda session: run_job("get-best-move", session),
+}
+
+def robot_request(session_id, action, message):
+    # Pedidos dos robôs pela conexão persistente, os mesmos das rotas HTTP
+    session = sessions.get(session_id)
+    if session is None:
+        raise LookupError(f"sessão {session_id} não existe")
+    if action not in ROBOT_ACTIONS:
+        raise LookupError(f"ação {action} não existe")
+    return ROBOT_ACTIONS[action](session)
+
+robot_link = RobotLink(robot_request, port=ROBOT_PORT, retry_interval=ROBOT_RETRY_INTERVAL, max_retries=ROBOT_MAX_RETRIES)
+
+@app.route("/robot", methods=["GET"])
+def robot_stats():
+    return jsonify(robot_link.stats()), 200
+
+
+def read_occupancy(session):
+    _, frame = get_latest_frame(session)
+    if frame is None:
+        return None
+    with session.lock:
+        if refresh_calibration(session, frame) is None:
+            return None
+        return classify_squares(frame, session.calibration)
+
+@session_route("/verify", methods=["GET"])
+def verify_board(session_id):
+    session = get_session(session_id)
+    grid = read_occupancy(session)
+    if grid is None:
+        return jsonify({"error": "❌ Não consegui enxergar o tabuleiro."}), 422
+
+    with session.lock:
+        wrong = mismatches(session.board, grid)
+    return jsonify({"in_sync": not wrong, "mismatches": wrong}), 200
+
+@session_route("/resync", methods=["GET"])
+def resync_board(session_id):
+    session = get_session(session_id)
+    grid = read_occupancy(session)
+    if grid is None:
+        return jsonify({"error": "❌ Não consegui enxergar o tabuleiro."}), 422
+
+    with session.lock:
+        wrong = mismatches(session.board, grid)
+        if wrong:
+            found = resync(session.board, grid)
+            if found is None:
+                session.message = "⚠️ O tabuleiro não bate com a minha memória e não consegui me localizar. Confira as peças!"
+                return jsonify({"in_sync": False, "mismatches": wrong}), 409
+            session.set_board(found)
+            session.message = "🔄 Corrigi minha memória do tabuleiro a partir da câmera!"
+
+        return jsonify({"in_sync": True, "fen": session.board.fen()}), 200
+
+
+@app.route("/engines", methods=["GET"])
+def engine_stats():
+    return jsonify(engines.stats()), 200
+
+@app.route("/cache", methods=["GET"])
+def cache_stats():
+    return jsonify(position_cache.stats()), 200
+
+@session_route("/camera", methods=["GET"])
+def camera_stats(session_id):
+    session = get_session(session_id)
+    return jsonify({**session.grabber.stats(), "format": session.camera_format}), 200
+
+
+@session_route("/status", methods=["GET"])
+def status(session_id):
+    session = get_session(session_id)
+    version, data = session.feed.latest()
+
+    response = Response(data, mimetype="application/json")
+    response.set_etag(session.feed.etag(version))
+    return response.make_conditional(request)
+
+@session_route("/events", methods=["GET"])
+def status_events(session_id):
+    session = get_session(session_id)
+    feed = session.feed
+    if not event_streams.acquire():
+        # Cada conexão ocupa uma thread: melhor o cliente consultar /status com ETag
+        response = jsonify({"error": "❌ Conexões de eventos demais, consulte /status."})
+        response.headers["Retry-After"] = str(EVENTS_KEEPALIVE)
+        return response, 503
+
+    # IDs are "<epoch>-<version>", like the ETags of /status
+    epoch, _, last = request.headers.get("Last-Event-ID", "").partition("-")
+    version = int(last) if epoch == feed.epoch and last.isdigit() else 0
+
+    # Waitress (serve.py) tells when the viewer left, so its slot frees up
+    # without waiting for a write to fail
+    disconnected = request.environ.get("waitress.client_disconnected", lambda: False)
+
+    def stream():
+        # An ID from another server run (or the future) starts over with the current status
+        seen = version if version <= feed.latest()[0] else 0
+        sent = monotonic()
+        while not feed.closed and not disconnected():
+            event = feed.wait(seen, timeout=EVENTS_CHECK_INTERVAL)
+            if event is None:
+                if monotonic() - sent >= EVENTS_KEEPALIVE:
+                    sent = monotonic()
+                    yield ": keepalive\n\n"
+                continue
+            seen, data = event
+            sent = monotonic()
+            yield f"id: {feed.etag(seen)}\nevent: status\ndata: {data}\n\n"
+
+    response = Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # The server closes the response whether or not the stream ever started
+    response.call_on_close(event_streams.release)
+    return response
+
+
+
+def start():
+    print("🤖 Inicializando sistema de xadrez robótico...")
+    table = sessions.get(DEFAULT_SESSION)
+    if not get_latest_frame(table)[0]:
+        raise RuntimeError("❌ A câmera não enviou nenhuma imagem.")
+    print("✅ Câmera conectada com sucesso!")
+    with engines.engine(timeout=READY_TIMEOUT) as engine:
+        engine.ping()
+    print("🧠 Motor de xadrez carregado!")
+    robot_link.start()
+    print(f"🔗 Aguardando robôs na porta {robot_link.port}")
+    table.message = "🎯 Sistema totalmente operacional! Estou pronto para nossa partida de xadrez!"
+    ready.set()
+
+def drain():
+    # Stops reporting ready and ends the event streams, so the server can stop
+    ready.clear()
+    for session in sessions.all():
+        session.feed.close()
+
+def shutdown():
+    with shutdown_lock:
+        if closed.is_set():
+            return
+        closed.set()
+        drain()
+        print("🔌 Desligando sistemas...")
+        robot_link.close()
+        jobs.close()
+        sessions.close_all()
+        engines.close()
+        position_cache.close()
+        book.close()
+        print("👋 Até a próxima partida!")
+
+@app.route("/ready", methods=["GET"])
+def readiness():
+    table = sessions.get(DEFAULT_SESSION)
+    frame_age = table.grabber.stats()["age"] if table is not None else None
+    engine_stats = engines.stats()
+    checks = {
+        "started": ready.is_set(),
+        "camera": frame_age is not None and frame_age < READY_MAX_FRAME_AGE,
+        "engine": not engines.closed and engine_stats["size"] > 0,
+    }
+    return jsonify(checks), 200 if all(checks.values()) else 503
 
 
 if __name__ == "__main__":
+    # Servidor de desenvolvimento; em produção use src/serve.py
     try:
-        print("🤖 Inicializando sistema de xadrez robótico...")
-        get_latest_frame(cap)
-        print("✅ Câmera conectada com sucesso!")
-        print("🧠 Motor de xadrez carregado!")
+        start()
         print("🚀 Servidor rodando em http://0.0.0.0:5000")
-        message = "🎯 Sistema totalmente operacional! Estou pronto para nossa partida de xadrez!"
-        app.run(host="0.0.0.0", port=5000)
+        app.run(host="0.0.0.0", port=5000, threaded=True)
     finally:
-        print("🔌 Desligando sistemas...")
-        engine.quit()
-        cap.release()
-        print("👋 Até a próxima partida!")
\ No newline at end of file
+        shutdown()
@@ -0,0 +1,47 @@
+from prometheus_client import Counter, Histogram
+
+# Buckets in seconds, from sub-millisecond vision stages up to long robot actions
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+DIFF_STAGE_SECONDS = Histogram(
+    "chessbot_diff_stage_seconds", "Time spent in each stage of diff()", ["stage"], buckets=LATENCY_BUCKETS
+)
+FRAME_GRAB_SECONDS = Histogram(
+    "chessbot_frame_grab_seconds", "Time to get a fresh frame from the camera", buckets=LATENCY_BUCKETS
+)
+ENGINE_PLAY_SECONDS = Histogram(
+    "chessbot_engine_play_seconds", "Latency of the engine search for a move", buckets=LATENCY_BUCKETS
+)
+ENGINE_NODES = Histogram(
+    "chessbot_engine_nodes", "Nodes searched per engine move",
+    buckets=(1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7)
+)
+ENGINE_DEPTH = Histogram(
+    "chessbot_engine_depth", "Depth reached per engine move", buckets=(1, 5, 10, 15, 20, 25, 30)
+)
+ROUTE_SECONDS = Histogram(
+    "chessbot_route_seconds", "Duration of each HTTP route", ["route"], buckets=LATENCY_BUCKETS
+)
+BOOK_HITS = Counter(
+    "chessbot_book_hits", "Engine moves taken from the opening book"
+)
+PONDER_HITS = Counter(
+    "chessbot_ponder_hits", "Engine moves answered from the search done during the human's turn"
+)
+POSITION_CACHE_HITS = Counter(
+    "chessbot_position_cache_hits", "Engine moves answered from the position cache"
+)
+UNRECOGNISED_MOVES = Counter(
+    "chessbot_unrecognised_moves", "Opponent moves the vision couldn't identify"
+)
+ILLEGAL_MOVES = Counter(
+    "chessbot_illegal_moves", "Opponent moves identified as changes that match no legal move"
+)
+
+
+def observe_stages(timings):
+    """
+    Records the stage durations collected by diff_scores(timings=...).
+    """
+    for stage, seconds in timings.items():
+        DIFF_STAGE_SECONDS.labels(stage=stage).observe(seconds)
@@ -0,0 +1,105 @@
+import chess
+import cv2
+import numpy as np
+
+from diff import board_matrix, detect_green_regions, detect_red_regions, square_change_scores
+
+# Sticker colours: red for the human (white), green for the robot (black)
+EMPTY = 0
+WHITE = 1
+BLACK = -1
+
+
+def classify_squares(frame, calibration, resolution=200, min_fraction=0.2):
+    """
+    Tells, from a single frame, which squares hold a red (white) piece, a
+    green (black) piece or nothing. The board is straightened with one warp
+    and both sticker masks are scored for the 64 squares at once.
+
+    Parameters:
+        frame: Raw BGR camera frame
+        calibration: Result of calibrate()
+        resolution: Size of the straightened board used for classification
+        min_fraction: Fraction of a square's centre covered by a sticker
+                      colour for it to count as occupied
+
+    Returns:
+        An 8x8 int8 array of EMPTY/WHITE/BLACK indexed as (row, col),
+        (0,0) being a8
+    """
+    matrix = board_matrix(calibration, frame.shape, resolution)
+    warped = cv2.warpPerspective(frame, matrix, (resolution, resolution))
+
+    red = square_change_scores(detect_red_regions(warped), margin=0.2)
+    green = square_change_scores(detect_green_regions(warped), margin=0.2)
+
+    grid = np.full((8, 8), EMPTY, dtype=np.int8)
+    grid[(red >= min_fraction) & (red >= green)] = WHITE
+    grid[(green >= min_fraction) & (green > red)] = BLACK
+    return grid
+
+
+def board_occupancy(board):
+    """
+    Occupancy grid of a chess.Board, in the same layout as classify_squares().
+    """
+    grid = np.full((8, 8), EMPTY, dtype=np.int8)
+    for square in chess.SquareSet(board.occupied_co[chess.WHITE]):
+        grid[7 - chess.square_rank(square), chess.square_file(square)] = WHITE
+    for square in chess.SquareSet(board.occupied_co[chess.BLACK]):
+        grid[7 - chess.square_rank(square), chess.square_file(square)] = BLACK
+    return grid
+
+
+def mismatches(board, grid):
+    """
+    Lists the squares where the camera disagrees with the board.
+
+    Returns:
+        List of dicts with the 'square' name and the 'expected'/'seen' content
+        ('white', 'black' or 'empty')
+    """
+    names = {EMPTY: "empty", WHITE: "white", BLACK: "black"}
+    expected = board_occupancy(board)
+
+    rows, cols = np.nonzero(expected != grid)
+    return [{
+        "square": chess.square_name(chess.square(int(col), 7 - int(row))),
+        "expected": names[int(expected[row, col])],
+        "seen": names[int(grid[row, col])],
+    } for row, col in zip(rows, cols)]
+
+
+def resync(board, grid):
+    """
+    Looks for the position the physical board is actually in, close to the
+    one we have: the current position, one legal move ahead, or the last
+    move replaced by another legal move (a misread move).
+
+    Returns:
+        The matching chess.Board, or None if there is no single match
+    """
+    candidates = [board.copy()]
+
+    for move in board.legal_moves:
+        candidate = board.copy()
+        candidate.push(move)
+        candidates.append(candidate)
+
+    if board.move_stack:
+        previous = board.copy()
+        last = previous.pop()
+        for move in previous.legal_moves:
+            if move == last:
+                continue
+            candidate = previous.copy()
+            candidate.push(move)
+            candidates.append(candidate)
+
+    matches = [candidate for candidate in candidates if np.array_equal(board_occupancy(candidate), grid)]
+
+    # Promotions to different pieces look the same to the camera, assume a queen
+    matches = [candidate for candidate in matches
+               if not candidate.move_stack or candidate.peek().promotion in (None, chess.QUEEN)]
+
+    return matches[0] if len(matches) == 1 else None
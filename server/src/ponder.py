@@ -0,0 +1,145 @@
+import threading
+
+import chess
+import chess.engine
+import chess.polyglot
+
+from engines import ENGINE_ERRORS
+
+
+class Ponderer:
+    """
+    Keeps the engine busy while the human thinks. After the robot moves,
+    a background thread predicts the human's likeliest replies (a short
+    MultiPV search) and analyses the position after each of them with the
+    engine's background analysis, keeping the deepest result per position.
+
+    When the human plays one of the predicted replies, lookup() answers
+    straight away with that result instead of a fresh search.
+
+    An engine is checked out of the pool for each search, and only a spare
+    one (see EnginePool), so pondering on one table never keeps another
+    table's move search waiting. With no spare engine, pondering stops.
+
+    start(), stop() and clear() may be called from any thread. Each run
+    has its own stop flag and results, so a thread that outlives stop()'s
+    join can't resume or write into the next run.
+    """
+
+    def __init__(self, pool, candidates=3, think_time=2.0, predict_time=0.2, min_depth=10):
+        self.pool = pool
+        self.candidates = candidates
+        self.think_time = think_time
+        self.predict_time = predict_time
+        self.min_depth = min_depth
+
+        self.results = {}
+        self.thread = None
+        self.analysis = None
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.control = threading.Lock()
+
+    def start(self, board):
+        """
+        Starts pondering on the position where the human is to move.
+        """
+        with self.control:
+            self._stop()
+            self.results = {}
+            if board.is_game_over():
+                return
+
+            self.stopping = threading.Event()
+            self.thread = threading.Thread(target=self._run, args=(board.copy(), self.stopping, self.results),
+                                           name="ponder", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=2.0):
+        """
+        Stops the background search, keeping what was found so far.
+        """
+        with self.control:
+            self._stop(timeout)
+
+    def clear(self):
+        """
+        Stops pondering and forgets its results (new game or new position).
+        """
+        with self.control:
+            self._stop()
+            self.results = {}
+
+    def _stop(self, timeout=2.0):
+        with self.lock:
+            self.stopping.set()
+            if self.analysis is not None:
+                try:
+                    self.analysis.stop()
+                except ENGINE_ERRORS:
+                    pass
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def lookup(self, board):
+        """
+        Returns the pondered result for this position ({'move', 'score',
+        'depth', 'time', 'nodes', 'nps'}), or None if it wasn't predicted or not searched
+        deep enough.
+        """
+        result = self.results.get(chess.polyglot.zobrist_hash(board))
+        if result is None or result["depth"] < self.min_depth or result["move"] not in board.legal_moves:
+            return None
+        return result
+
+    def _search(self, board, stopping, limit, multipv=None):
+        with self.pool.engine(spare=True) as engine:
+            if engine is None:
+                stopping.set()
+                return None
+            with self.lock:
+                if stopping.is_set():
+                    return None
+                self.analysis = engine.analysis(board, limit, multipv=multipv)
+            try:
+                with self.analysis:
+                    self.analysis.wait()
+                    return self.analysis.multipv if multipv else self.analysis.info
+            finally:
+                with self.lock:
+                    self.analysis = None
+
+    def _run(self, board, stopping, results):
+        try:
+            self._ponder(board, stopping, results)
+        except ENGINE_ERRORS as e:
+            # Pondering is only a head start, the move search will retry
+            print(e)
+
+    def _ponder(self, board, stopping, results):
+        predictions = self._search(board, stopping, chess.engine.Limit(time=self.predict_time), multipv=self.candidates)
+        if not predictions:
+            return
+
+        replies = [info["pv"][0] for info in predictions if info.get("pv")]
+
+        for reply in replies:
+            if stopping.is_set():
+                return
+
+            position = board.copy()
+            position.push(reply)
+            if position.is_game_over():
+                continue
+
+            info = self._search(position, stopping, chess.engine.Limit(time=self.think_time))
+            if info and info.get("pv"):
+                results[chess.polyglot.zobrist_hash(position)] = {
+                    "move": info["pv"][0],
+                    "score": info.get("score"),
+                    "depth": info.get("depth", 0),
+                    "time": info.get("time", 0.0),
+                    "nodes": info.get("nodes", 0),
+                    "nps": info.get("nps", int(info.get("nodes", 0) / info["time"]) if info.get("time") else 0),
+                }
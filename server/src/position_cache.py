@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import chess
+import chess.polyglot
+
+MATE_SCORE = 100000
+
+
+class PositionCache:
+    """
+    Engine results (best move, score, depth, nodes, nps and search time) keyed by the
+    Zobrist hash of the position. Recent entries live in an in-memory LRU;
+    every entry is also written to a small SQLite file, so the cache
+    survives restarts.
+
+    An entry is only reused when it was searched at least to the requested
+    depth. The time is the search's real duration, kept for the stats: a
+    search that stopped early on a stable move is no shallower for it.
+    """
+
+    def __init__(self, path, capacity=10000):
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS positions ("
+            "key INTEGER PRIMARY KEY, move TEXT, score INTEGER, depth INTEGER, time REAL, "
+            "nodes INTEGER DEFAULT 0, nps INTEGER DEFAULT 0)"
+        )
+        # Files from before nodes and nps were kept
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(positions)")}
+        for column in ("nodes", "nps"):
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE positions ADD COLUMN {column} INTEGER DEFAULT 0")
+        self.db.commit()
+
+    @staticmethod
+    def key(board):
+        # SQLite integers are signed 64-bit
+        return chess.polyglot.zobrist_hash(board) - (1 << 63)
+
+    def _remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def lookup(self, board, depth):
+        """
+        Returns {'move', 'score', 'depth', 'time', 'nodes', 'nps'} for this position if an
+        entry searched to at least depth exists, else None.
+        The score is in centipawns from White's point of view.
+        """
+        key = self.key(board)
+
+        with self.lock:
+            entry = self.memory.get(key)
+            tier = "memory"
+            if entry is None:
+                row = self.db.execute(
+                    "SELECT move, score, depth, time, nodes, nps FROM positions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = {"move": chess.Move.from_uci(row[0]), "score": row[1], "depth": row[2], "time": row[3],
+                             "nodes": row[4] or 0, "nps": row[5] or 0}
+                    tier = "disk"
+
+            if entry is None or entry["depth"] < depth or entry["move"] not in board.legal_moves:
+                self.misses += 1
+                return None
+
+            self._remember(key, entry)
+            self.hits[tier] += 1
+            return entry
+
+    def store(self, board, move, score=None, depth=0, time=0.0, nodes=0, nps=0):
+        """
+        Saves an engine result, keeping the deeper one if the position is
+        already cached. score is a chess.engine.PovScore (or None).
+        """
+        key = self.key(board)
+        cp = score.white().score(mate_score=MATE_SCORE) if score is not None else None
+        entry = {"move": move, "score": cp, "depth": depth, "time": time, "nodes": nodes, "nps": nps}
+
+        with self.lock:
+            current = self.memory.get(key)
+            if current is not None and current["depth"] > depth:
+                return
+
+            self._remember(key, entry)
+            self.db.execute(
+                "INSERT INTO positions (key, move, score, depth, time, nodes, nps) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET move = excluded.move, score = excluded.score, "
+                "depth = excluded.depth, time = excluded.time, nodes = excluded.nodes, nps = excluded.nps "
+                "WHERE excluded.depth >= positions.depth",
+                (key, move.uci(), cp, depth, time, nodes, nps),
+            )
+            self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            hits = self.hits["memory"] + self.hits["disk"]
+            lookups = hits + self.misses
+            return {
+                "memory_entries": len(self.memory),
+                "memory_hits": self.hits["memory"],
+                "disk_hits": self.hits["disk"],
+                "misses": self.misses,
+                "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
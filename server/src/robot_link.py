@@ -0,0 +1,436 @@
+"""
+Persistent link between the server and the robot controllers: one TCP
+connection per robot, kept open, carrying one JSON object per line.
+
+    robot  -> server  {"type": "hello", "session": "default", "boot": "3f9a0c1e"}
+    server -> robot   {"type": "welcome", "session": "default", "boot": "b7d2e410", "time": 81234}
+    robot  -> server  {"type": "request", "seq": 1, "action": "get-best-move"}
+    server -> robot   {"type": "ack", "ack": 1}
+    server -> robot   {"type": "result", "seq": 4, "re": 1, "ok": true, "result": {...}}
+    robot  -> server  {"type": "ack", "ack": 4}
+    server -> robot   {"type": "command", "seq": 5, "command": "play", "data": {...}, "expires": 86250}
+    robot  -> server  {"type": "ack", "ack": 5}
+    robot  -> server  {"type": "done", "seq": 2, "re": 5, "ok": true}
+
+Every message with a seq is acknowledged on arrival and resent until it
+is, at most max_retries times, then given up on. seq counts per sender
+and both ends drop duplicates, so resending is always safe. boot
+identifies a run of each end: when it changes, the other side restarted
+and numbers from 1 again. A robot that reconnects gets its session's
+unacknowledged messages straight away.
+
+Giving up on a command doesn't take it back: TCP may already have
+delivered it to a socket buffer the robot isn't reading yet. So commands
+carry expires, in ms on the server's clock (welcome's time tells the
+robot where that clock is), set a retry interval before the server gives
+up. A robot that reads a command after it expired doesn't run it and
+answers done with ok false, so an arm move never happens minutes late.
+"""
+import json
+import os
+import secrets
+import socket
+import struct
+import threading
+from collections import OrderedDict, deque
+from time import monotonic
+
+SEEN_WINDOW = 256
+SEND_TIMEOUT = 5.0  # s a write may block on a peer that stopped reading
+
+
+class Peer:
+    """
+    The numbering, acknowledgement, retry and de-duplication of one end of
+    a link. Outlives its connections: attach() a new socket after a
+    reconnect and the messages not yet acknowledged are sent again.
+    """
+
+    def __init__(self, on_message, on_failed=None, retry_interval=1.0, max_retries=5):
+        self.on_message = on_message
+        self.on_failed = on_failed
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        self.boot = secrets.token_hex(4)
+        self.remote_boot = None
+        self.sock = None
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+        self.seq = 0
+        self.outbox = OrderedDict()
+        self.seen = deque(maxlen=SEEN_WINDOW)
+        self.seen_set = set()
+
+        self.sent = 0
+        self.retries = 0
+        self.acked = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.rtts = deque(maxlen=100)
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def attach(self, sock, remote_boot):
+        with self.lock:
+            if remote_boot != self.remote_boot:
+                # The other end restarted and numbers its messages from 1 again
+                self.seen.clear()
+                self.seen_set.clear()
+                self.remote_boot = remote_boot
+            self.sock = sock
+            now = monotonic()
+            for entry in self.outbox.values():
+                entry["sent"] = now
+            pending = [entry["message"] for entry in self.outbox.values()]
+        for message in pending:
+            self._write(sock, message)
+
+    def detach(self, sock):
+        with self.lock:
+            if self.sock is sock:
+                self.sock = None
+
+    def send(self, message):
+        """
+        Sends message reliably: numbered, kept until acknowledged and resent
+        meanwhile. Returns its seq.
+        """
+        message = self.enqueue(message)
+        self.flush(message)
+        return message["seq"]
+
+    def enqueue(self, message):
+        """
+        Numbers message and puts it in the outbox without writing it yet,
+        so the caller can register its seq before a reply can arrive.
+        Returns the numbered message, for flush().
+        """
+        with self.lock:
+            self.seq += 1
+            message = dict(message, seq=self.seq)
+            self.outbox[self.seq] = {"message": message, "sent": monotonic(), "attempts": 1}
+            self.sent += 1
+            return message
+
+    def flush(self, message):
+        """
+        Writes an enqueued message (if connected; attach() sends it otherwise).
+        """
+        sock = self.sock
+        if sock is not None:
+            self._write(sock, message)
+
+    def post(self, message):
+        """
+        Sends message once, unnumbered (acknowledgements, handshake).
+        """
+        sock = self.sock
+        if sock is not None:
+            self._write(sock, message)
+
+    def _write(self, sock, message):
+        data = (json.dumps(message, separators=(",", ":"), ensure_ascii=False) + "\n").encode()
+        try:
+            with self.write_lock:
+                sock.sendall(data)
+        except OSError:
+            # A timed out write may have sent half a line: drop the
+            # connection, the reading side detaches it and the robot
+            # reconnects
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def receive(self, message):
+        """
+        Handles a message from the other end: acknowledges it and passes it
+        to on_message once, however many times it was sent.
+        """
+        if message.get("type") == "ack":
+            with self.lock:
+                entry = self.outbox.pop(message.get("ack"), None)
+                if entry is not None:
+                    self.acked += 1
+                    if entry["attempts"] == 1:
+                        self.rtts.append(monotonic() - entry["sent"])
+            return
+
+        seq = message.get("seq")
+        if seq is not None:
+            self.post({"type": "ack", "ack": seq})
+            with self.lock:
+                if seq in self.seen_set:
+                    self.duplicates += 1
+                    return
+                if len(self.seen) == self.seen.maxlen:
+                    self.seen_set.discard(self.seen[0])
+                self.seen.append(seq)
+                self.seen_set.add(seq)
+        self.on_message(message)
+
+    def resend_due(self):
+        """
+        Resends the messages unacknowledged for retry_interval and gives up
+        on those past max_retries. Called periodically. A disconnected peer
+        keeps counting attempts, so its messages expire too.
+        """
+        now = monotonic()
+        resend, failed = [], []
+        with self.lock:
+            for seq, entry in list(self.outbox.items()):
+                if now - entry["sent"] < self.retry_interval:
+                    continue
+                if entry["attempts"] > self.max_retries:
+                    del self.outbox[seq]
+                    self.failed += 1
+                    failed.append(entry["message"])
+                    continue
+                entry["attempts"] += 1
+                entry["sent"] = now
+                self.retries += 1
+                resend.append(entry["message"])
+            sock = self.sock
+
+        if sock is not None:
+            for message in resend:
+                self._write(sock, message)
+        if self.on_failed is not None:
+            for message in failed:
+                self.on_failed(message)
+
+    def stats(self):
+        with self.lock:
+            rtts = sorted(self.rtts)
+            return {
+                "connected": self.sock is not None,
+                "sent": self.sent,
+                "acked": self.acked,
+                "retries": self.retries,
+                "failed": self.failed,
+                "duplicates": self.duplicates,
+                "pending": len(self.outbox),
+                "rtt_ms": round(rtts[len(rtts) // 2] * 1000, 2) if rtts else None,
+            }
+
+
+def read_messages(sock):
+    """
+    Yields the JSON messages arriving on sock until it closes. Lines that
+    aren't JSON objects are skipped.
+    """
+    with sock.makefile("r", encoding="utf-8", newline="\n") as lines:
+        try:
+            for line in lines:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(message, dict):
+                    yield message
+        except (OSError, UnicodeDecodeError):
+            return
+
+
+def tune(sock, send_timeout=SEND_TIMEOUT):
+    # Small messages that someone is waiting for: don't batch them
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Writes only: a timeout on the socket itself would end idle reads too
+    if os.name == "nt":
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, int(send_timeout * 1000))
+    else:
+        seconds = int(send_timeout)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO,
+                        struct.pack("ll", seconds, int((send_timeout - seconds) * 1_000_000)))
+
+
+class Command:
+    """
+    A command sent to a robot. wait() returns once the robot reports it
+    done, or the link gave up on it.
+    """
+
+    def __init__(self, session_id, name):
+        self.session_id = session_id
+        self.name = name
+        self.seq = None
+        self.ok = None
+        self.result = None
+        self.error = None
+        self.event = threading.Event()
+
+    def finish(self, ok, result=None, error=None):
+        self.ok, self.result, self.error = ok, result, error
+        self.event.set()
+
+    def wait(self, timeout=None):
+        return self.event.wait(timeout)
+
+
+class RobotLink:
+    """
+    TCP server for the robot controllers, one Peer per session (table).
+
+    Requests from a robot run on their own thread through
+    on_request(session_id, action, message), whose return value (or
+    exception) goes back as the result. command() sends the robot
+    something to do, whenever the server decides to.
+    """
+
+    def __init__(self, on_request, host="0.0.0.0", port=5001, retry_interval=1.0, max_retries=5):
+        self.on_request = on_request
+        self.host = host
+        self.port = port
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+
+        self.peers = {}
+        self.commands = {}
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.server = None
+        self.threads = []
+        self.started = monotonic()
+
+    def start(self):
+        self.server = socket.create_server((self.host, self.port))
+        # With port 0 the system picks one
+        self.port = self.server.getsockname()[1]
+        for target, name in ((self._accept_loop, "robot-link"), (self._retry_loop, "robot-retry")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _peer(self, session_id):
+        with self.lock:
+            peer = self.peers.get(session_id)
+            if peer is None:
+                peer = Peer(lambda message: self._on_message(session_id, message),
+                            lambda message: self._on_failed(session_id, message),
+                            self.retry_interval, self.max_retries)
+                self.peers[session_id] = peer
+            return peer
+
+    def _accept_loop(self):
+        while not self.closed.is_set():
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            tune(sock)
+            threading.Thread(target=self._serve, args=(sock,), name="robot-conn", daemon=True).start()
+
+    def _serve(self, sock):
+        messages = read_messages(sock)
+        peer = None
+        try:
+            hello = next(messages, None)
+            if hello is None or hello.get("type") != "hello" or not hello.get("session"):
+                return
+            peer = self._peer(str(hello["session"]))
+            old = peer.sock
+            if old is not None:
+                # The robot reconnected; its old connection is dead or about to be
+                try:
+                    old.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            welcome = {"type": "welcome", "session": hello["session"], "boot": peer.boot, "time": self.clock()}
+            sock.sendall((json.dumps(welcome) + "\n").encode())
+            peer.attach(sock, hello.get("boot"))
+            print(f"🔗 Robô conectado à mesa {hello['session']}")
+
+            for message in messages:
+                peer.receive(message)
+        except OSError:
+            pass
+        finally:
+            if peer is not None:
+                peer.detach(sock)
+            sock.close()
+
+    def _retry_loop(self):
+        while not self.closed.wait(self.retry_interval / 4):
+            with self.lock:
+                peers = list(self.peers.values())
+            for peer in peers:
+                peer.resend_due()
+
+    def _on_message(self, session_id, message):
+        kind = message.get("type")
+        if kind == "request":
+            threading.Thread(target=self._answer, args=(session_id, message), name="robot-request", daemon=True).start()
+        elif kind == "done":
+            with self.lock:
+                command = self.commands.pop((session_id, message.get("re")), None)
+            if command is not None:
+                command.finish(bool(message.get("ok", True)), message.get("result"), message.get("error"))
+
+    def _on_failed(self, session_id, message):
+        if message.get("type") == "command":
+            with self.lock:
+                command = self.commands.pop((session_id, message["seq"]), None)
+            if command is not None:
+                command.finish(False, error="not acknowledged")
+
+    def _answer(self, session_id, message):
+        try:
+            reply = {"ok": True, "result": self.on_request(session_id, message.get("action"), message)}
+        except Exception as error:
+            reply = {"ok": False, "error": str(error) or type(error).__name__}
+        self._peer(session_id).send({"type": "result", "re": message["seq"], **reply})
+
+    def clock(self):
+        """
+        The link's clock for expires: ms since start().
+        """
+        return int((monotonic() - self.started) * 1000)
+
+    def connected(self, session_id):
+        with self.lock:
+            peer = self.peers.get(session_id)
+        return peer is not None and peer.connected
+
+    def command(self, session_id, name, data=None):
+        """
+        Sends the command name to the robot of session_id. Returns a
+        Command; it fails if the robot doesn't acknowledge it in time, or
+        reads it too late (expired).
+        """
+        command = Command(session_id, name)
+        peer = self._peer(session_id)
+        # One retry interval before resend_due() gives up, for the ack to come back
+        expires = self.clock() + int(self.retry_interval * self.max_retries * 1000)
+        message = peer.enqueue({"type": "command", "command": name, "data": data, "expires": expires})
+        command.seq = message["seq"]
+        # Registered before it is written, so a quick "done" finds it
+        with self.lock:
+            self.commands[(session_id, command.seq)] = command
+        peer.flush(message)
+        return command
+
+    def stats(self):
+        with self.lock:
+            peers = dict(self.peers)
+        return {"port": self.port, "sessions": {session_id: peer.stats() for session_id, peer in peers.items()}}
+
+    def close(self):
+        self.closed.set()
+        if self.server is not None:
+            self.server.close()
+        with self.lock:
+            peers = list(self.peers.values())
+            commands = list(self.commands.values())
+            self.commands.clear()
+        for peer in peers:
+            if peer.sock is not None:
+                try:
+                    peer.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        for command in commands:
+            command.finish(False, error="link closed")
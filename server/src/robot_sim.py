@@ -0,0 +1,239 @@
+"""
+Simulated robot controller for the persistent link (robot_link.py): it
+connects like the ESP32, plays its loop (/reset once, then
+capture-board-state, confirm-opponent-move and get-best-move, "moving"
+the arm for the plan's duration) and carries out the commands the server
+pushes. When the camera doesn't see a move (the stand-in camera never
+does), it plays a random one for the human through POST /opponent-move.
+--drop throws away that fraction of the messages it receives, to
+exercise the retries. Prints the round trip of each request, and checks
+in the game's PGN that the engine only ever played black.
+
+Run the server on the stand-in camera and engine, as for loadtest.py:
+
+    cd $(mktemp -d)
+    CHESSBOT_CAMERA=/path/to/server/vision \
+    CHESSBOT_ENGINE="python3 /path/to/server/src/fake_engine.py --latency 0.2" \
+    CHESSBOT_CAPTURE_COUNTDOWN=0 \
+    python3 /path/to/server/src/serve.py
+
+Usage:
+    python3 src/robot_sim.py [--host localhost] [--port 5001] [--server http://localhost:5000] [--moves 10] [--drop 0.1]
+"""
+import argparse
+import io
+import json
+import random
+import socket
+import threading
+from collections import defaultdict
+from time import monotonic, perf_counter, sleep
+
+import chess
+import chess.pgn
+import numpy as np
+import requests
+
+from robot_link import Peer, read_messages, tune
+
+ENGINE_SOURCES = ("book", "ponder", "cache", "engine")
+
+
+class SimulatedRobot:
+    def __init__(self, host="localhost", port=5001, session="default", time_scale=0.0, drop=0.0, seed=None,
+                 retry_interval=1.0, max_retries=5, server="http://localhost:5000"):
+        self.host = host
+        self.port = port
+        self.session = session
+        self.server = f"{server.rstrip('/')}/sessions/{session}"
+        self.http = requests.Session()
+        self.time_scale = time_scale
+        self.drop = drop
+        self.rng = random.Random(seed)
+
+        self.peer = Peer(self._on_message, self._on_failed, retry_interval, max_retries)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.executed = []
+        self.closed = threading.Event()
+        self.connected = threading.Event()
+        self.dropped = 0
+        self.expired = 0
+        self.clock_offset = 0.0
+
+    def start(self):
+        threading.Thread(target=self._run, name="robot-sim", daemon=True).start()
+        threading.Thread(target=self._retry_loop, name="robot-sim-retry", daemon=True).start()
+        if not self.connected.wait(10):
+            raise ConnectionError(f"no link to {self.host}:{self.port}")
+
+    def _run(self):
+        # Keeps the link up: reconnects whenever it drops, like the ESP32 after a WiFi hiccup
+        while not self.closed.is_set():
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=5)
+            except OSError:
+                sleep(0.5)
+                continue
+            sock.settimeout(None)
+            tune(sock)
+            try:
+                sock.sendall((json.dumps({"type": "hello", "session": self.session, "boot": self.peer.boot}) + "\n").encode())
+                messages = read_messages(sock)
+                welcome = next(messages, None)
+                if welcome is None or welcome.get("type") != "welcome":
+                    continue
+                # Where the server's clock is, for the commands' expires
+                self.clock_offset = welcome.get("time", 0) - monotonic() * 1000
+                self.peer.attach(sock, welcome.get("boot"))
+                self.connected.set()
+                for message in messages:
+                    if self.drop and self.rng.random() < self.drop:
+                        self.dropped += 1
+                        continue
+                    self.peer.receive(message)
+            except OSError:
+                pass
+            finally:
+                self.connected.clear()
+                self.peer.detach(sock)
+                sock.close()
+
+    def _retry_loop(self):
+        while not self.closed.wait(self.peer.retry_interval / 4):
+            self.peer.resend_due()
+
+    def _on_message(self, message):
+        kind = message.get("type")
+        if kind == "result":
+            with self.lock:
+                waiter = self.pending.get(message.get("re"))
+            if waiter is not None:
+                waiter["reply"] = message
+                waiter["event"].set()
+        elif kind == "command":
+            threading.Thread(target=self._execute, args=(message,), daemon=True).start()
+
+    def _on_failed(self, message):
+        with self.lock:
+            waiter = self.pending.get(message.get("seq"))
+        if waiter is not None:
+            waiter["reply"] = {"ok": False, "error": "not acknowledged"}
+            waiter["event"].set()
+
+    def _execute(self, message):
+        expires = message.get("expires")
+        if expires is not None and monotonic() * 1000 + self.clock_offset > expires:
+            # Read too late: the server has given up on it already
+            with self.lock:
+                self.expired += 1
+            self.peer.send({"type": "done", "re": message["seq"], "ok": False, "error": "expired"})
+            return
+        data = message.get("data") or {}
+        plan = data.get("plan") or {}
+        sleep(plan.get("ms", 0) / 1000 * self.time_scale)
+        with self.lock:
+            self.executed.append((message["command"], message["seq"]))
+        self.peer.send({"type": "done", "re": message["seq"], "ok": True})
+
+    def request(self, action, timeout=60):
+        """
+        Asks the server for action and returns its result.
+        """
+        waiter = {"event": threading.Event(), "reply": None}
+        message = self.peer.enqueue({"type": "request", "action": action})
+        seq = message["seq"]
+        # Registered before it is written, so a quick reply finds it
+        with self.lock:
+            self.pending[seq] = waiter
+        self.peer.flush(message)
+        try:
+            if not waiter["event"].wait(timeout):
+                raise TimeoutError(action)
+        finally:
+            with self.lock:
+                self.pending.pop(seq, None)
+        reply = waiter["reply"]
+        if not reply.get("ok"):
+            raise RuntimeError(f"{action}: {reply.get('error')}")
+        return reply.get("result")
+
+    def play(self, moves, latencies):
+        self.request("reset")
+        for _ in range(moves):
+            for action in ("capture-board-state", "confirm-opponent-move"):
+                start = perf_counter()
+                result = self.request(action)
+                latencies[action].append(perf_counter() - start)
+            if not (result or {}).get("accepted") and not self.opponent_move():
+                break
+
+            start = perf_counter()
+            result = self.request("get-best-move")
+            latencies["get-best-move"].append(perf_counter() - start)
+            plan = (result or {}).get("plan") or {}
+            sleep(plan.get("ms", 0) / 1000 * self.time_scale)
+        self.check_game()
+
+    def opponent_move(self):
+        """
+        Plays a random legal move for the human. Returns False if the game
+        is over.
+        """
+        status = self.http.get(f"{self.server}/status", timeout=10)
+        status.raise_for_status()
+        board = chess.Board(status.json()["fen"])
+        if board.is_game_over():
+            return False
+        move = self.rng.choice(list(board.legal_moves))
+        self.http.post(f"{self.server}/opponent-move", params={"uci": move.uci()}, timeout=10).raise_for_status()
+        return True
+
+    def check_game(self):
+        """
+        Raises AssertionError if the engine played a move for white.
+        """
+        response = self.http.get(f"{self.server}/game.pgn", timeout=10)
+        response.raise_for_status()
+        game = chess.pgn.read_game(io.StringIO(response.text))
+        for node in game.mainline():
+            mover = node.parent.board().turn
+            if node.comment.split(" ")[0] in ENGINE_SOURCES and mover != chess.BLACK:
+                raise AssertionError(f"engine played {node.san()} for white (ply {node.ply()})")
+
+    def close(self):
+        self.closed.set()
+        sock = self.peer.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated robot controller for the ChessBot link")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--server", default="http://localhost:5000", help="Server's HTTP address, for the human's moves")
+    parser.add_argument("--session", default="default", help="Table to play on")
+    parser.add_argument("--moves", type=int, default=10, help="Robot moves to play")
+    parser.add_argument("--time-scale", type=float, default=0.0, help="Fraction of each plan's duration to wait (1 = real time)")
+    parser.add_argument("--drop", type=float, default=0.0, help="Fraction of received messages to lose")
+    parser.add_argument("--seed", type=int, help="Seed for the losses")
+    args = parser.parse_args()
+
+    robot = SimulatedRobot(args.host, args.port, args.session, args.time_scale, args.drop, args.seed,
+                           server=args.server)
+    robot.start()
+    latencies = defaultdict(list)
+    try:
+        robot.play(args.moves, latencies)
+    finally:
+        robot.close()
+
+    print(f"{'request':<24}{'count':>7}{'p50 (ms)':>10}{'max (ms)':>10}")
+    for action, values in latencies.items():
+        ms = np.array(values) * 1000
+        print(f"{action:<24}{len(ms):>7}{np.percentile(ms, 50):>10.1f}{ms.max():>10.1f}")
+    print(f"\nlink: {robot.peer.stats()}, {robot.dropped} messages dropped, {robot.expired} commands expired")
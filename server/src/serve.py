@@ -0,0 +1,58 @@
+"""
+Production entry point: serves the app with Waitress, a multi-threaded
+WSGI server, instead of Flask's development server.
+
+Request threads share the camera, the engines and each session's game
+state through the frame grabber, the engine pool and the session locks;
+the move watcher and the ponderer serialise their own start and stop.
+This script adds the lifecycle around them: /ready only answers 200 once
+the camera and an engine have responded, at most half the threads serve
+/events streams (the rest get 503), and SIGTERM/SIGINT stop the server,
+end the event streams, quit the engines and release the cameras.
+
+Usage:
+    python3 src/serve.py [--host 0.0.0.0] [--port 5000] [--threads 16]
+"""
+import argparse
+import signal
+
+from waitress import create_server
+
+import main
+
+
+def serve(host, port, threads):
+    # Event streams hold a thread each: keep at least half for the rest
+    main.event_streams.limit = max(1, min(main.MAX_EVENT_STREAMS, threads // 2))
+    # Lookahead keeps reading the sockets during a request, so Waitress
+    # notices a viewer that closed its /events stream
+    server = create_server(main.app, host=host, port=port, threads=threads, channel_request_lookahead=1)
+
+    def stop(signum, frame):
+        # A second signal during shutdown must not interrupt the cleanup
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        main.drain()
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        main.start()
+        print(f"🚀 Servidor rodando em http://{host}:{port} ({threads} threads)")
+        # Returns once a signal arrives
+        server.run()
+    finally:
+        server.close()
+        main.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ChessBot server (production)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=16, help="Request threads (at most half serve /events)")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.threads)
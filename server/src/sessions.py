@@ -0,0 +1,223 @@
+import threading
+from time import monotonic
+
+import chess
+
+from artifacts import ArtifactCache
+from camera import FrameGrabber, describe, open_capture
+from events import StatusFeed
+from ponder import Ponderer
+from watcher import MoveWatcher
+
+WELCOME_MESSAGE = "🤖 Olá! Sou seu adversário de xadrez robótico. Estou online e pronto para jogar!"
+RESTORED_MESSAGE = "♻️ Voltei! Recuperei nossa partida em andamento, pode continuar de onde paramos."
+
+
+class GameSession:
+    """
+    Everything one physical table needs: its board, its camera (with the
+    frame grabber and move watcher on top of it), the captured frames (and
+    the artifacts of the last moves), the calibration, the ponderer and the
+    status message.
+
+    Setting message (or calling publish() after changing the board)
+    publishes the status to the session's feed.
+
+    The board should only change through push(), new_game() and
+    set_board(), which also write to the journal (if any). A game in
+    progress in the journal is restored on creation.
+
+    Handlers must hold lock while reading or changing the game state.
+    Long waits (countdowns, sleeps) should happen outside of it.
+    """
+
+    def __init__(self, session_id, camera, engines, on_move, journal=None):
+        self.id = session_id
+        self.camera = camera
+        self.lock = threading.RLock()
+        self.last_access = monotonic()
+
+        self.feed = StatusFeed()
+        self.ponderer = Ponderer(engines)
+        self.journal = journal
+        board, self.moves = journal.replay() if journal is not None else (None, [])
+        if board is None:
+            self.new_game()
+            self.message = WELCOME_MESSAGE
+        else:
+            self.board = board
+            self.message = RESTORED_MESSAGE
+        self.img1 = None
+        self.img2 = None
+        self.artifacts = ArtifactCache()
+        self.calibration = None
+        # Move sent to the robot (play), only pushed once the robot is done
+        self.robot_move = None
+
+        self.cap = open_capture(camera)
+        self.camera_format = describe(self.cap)
+        self.grabber = FrameGrabber(self.cap).start()
+        self.watcher = MoveWatcher(self.grabber, lambda frame: on_move(self, frame))
+
+    @property
+    def message(self):
+        return self._message
+
+    @message.setter
+    def message(self, message):
+        self._message = message
+        self.publish()
+
+    def status(self):
+        with self.lock:
+            board = self.board
+
+            # Mensagens dinâmicas baseadas no estado do jogo
+            game_status = ""
+            if board.is_game_over():
+                if board.is_checkmate():
+                    game_status = " | 🏁 Jogo finalizado!"
+                elif board.is_stalemate():
+                    game_status = " | 🤝 Empate!"
+            elif board.is_check():
+                game_status = " | ⚠️ Rei em xeque!"
+
+            return {
+                "fen": board.fen(),
+                "message": self._message + game_status,
+                "turn": "Sua vez" if board.turn == chess.WHITE else "Minha vez",
+                "move_count": board.fullmove_number
+            }
+
+    def publish(self):
+        # Under the lock, so statuses reach the feed in order
+        with self.lock:
+            self.feed.publish(self.status())
+
+    def push(self, move, source, confidence=None):
+        """
+        Plays the move on the board and journals it, exporting the game to
+        PGN if it ended. Call with lock held.
+        """
+        self.board.push(move)
+        self.moves.append({"source": source, "confidence": confidence})
+        if self.journal is not None:
+            self.journal.move(move, source, confidence)
+            if self.board.is_game_over():
+                self.journal.end(self.board, self.moves)
+
+    def new_game(self):
+        self.ponderer.clear()
+        self.board = chess.Board()
+        self.moves = []
+        if self.journal is not None:
+            self.journal.start(self.board)
+
+    def set_board(self, board):
+        """
+        Replaces the board (after a resync) and journals the new position.
+        Moves shared with the old move stack keep their source and
+        confidence; the others are marked as coming from the position.
+        """
+        self.ponderer.clear()
+        shared = 0
+        if self.board.root() == board.root():
+            for old, new in zip(self.board.move_stack, board.move_stack):
+                if old != new:
+                    break
+                shared += 1
+        self.moves = self.moves[:shared] + [{"source": "position"} for _ in board.move_stack[shared:]]
+        self.board = board
+        if self.journal is not None:
+            self.journal.position(board)
+
+    def touch(self):
+        self.last_access = monotonic()
+
+    def close(self):
+        self.feed.close()
+        self.watcher.stop()
+        self.ponderer.stop()
+        self.grabber.stop()
+        self.cap.release()
+        if self.journal is not None:
+            self.journal.close()
+
+
+class SessionRegistry:
+    """
+    Game sessions keyed by ID. Sessions that weren't accessed for
+    idle_timeout seconds are closed and evicted, except the pinned ones
+    (the default table).
+    """
+
+    def __init__(self, factory, idle_timeout=3600, pinned=()):
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.pinned = set(pinned)
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def open(self, session_id, camera):
+        """
+        Returns the session with this ID, creating it on the given camera
+        if it doesn't exist yet.
+        """
+        self.evict_idle()
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.factory(session_id, camera)
+                self.sessions[session_id] = session
+        session.touch()
+        return session
+
+    def get(self, session_id):
+        """
+        Returns the session with this ID, or None.
+        """
+        self.evict_idle()
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is not None:
+            session.touch()
+        return session
+
+    def evict_idle(self):
+        now = monotonic()
+        with self.lock:
+            idle = [session for session_id, session in self.sessions.items()
+                    if session_id not in self.pinned and now - session.last_access > self.idle_timeout]
+            for session in idle:
+                del self.sessions[session.id]
+
+        for session in idle:
+            session.close()
+
+    def close(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+        return session is not None
+
+    def close_all(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def all(self):
+        with self.lock:
+            return list(self.sessions.values())
+
+    def list(self):
+        now = monotonic()
+        with self.lock:
+            return [{
+                "id": session.id,
+                "camera": session.camera,
+                "fen": session.board.fen(),
+                "idle": round(now - session.last_access, 1),
+            } for session in self.sessions.values()]
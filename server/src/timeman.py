@@ -0,0 +1,106 @@
+from time import monotonic
+
+import chess
+import chess.engine
+
+TYPICAL_MOVE_COUNT = 30
+
+
+class TimeManager:
+    """
+    Decides how long the engine thinks about each position, instead of a
+    fixed time and depth.
+
+    The base budget is what's left of turn_time once the arm has moved
+    (arm_time). It is scaled by the number of legal moves (more choices,
+    more time), and stretched up to max_time while the evaluation swings
+    between iterations. The search stops early once the best move has been
+    the same for stable_iterations iterations in a row, but never before
+    min_depth: the first iterations agree on a move because they are too
+    shallow to see anything else.
+    """
+
+    def __init__(self, turn_time=3.0, arm_time=2.0, min_time=0.05, max_time=3.0, max_depth=30,
+                 stable_iterations=4, volatility_scale=50, min_depth=8):
+        self.turn_time = turn_time
+        self.arm_time = arm_time
+        self.min_time = min_time
+        self.max_time = max_time
+        self.max_depth = max_depth
+        self.min_depth = min_depth
+        self.stable_iterations = stable_iterations
+        self.volatility_scale = volatility_scale
+
+    def budget(self, board):
+        """
+        Returns (soft, hard): the time in seconds the search normally gets,
+        and the most it may take while the evaluation is unstable.
+        """
+        base = max(self.min_time, self.turn_time - self.arm_time)
+        complexity = min(max(board.legal_moves.count() / TYPICAL_MOVE_COUNT, 0.5), 1.5)
+        soft = min(max(base * complexity, self.min_time), self.max_time)
+        hard = min(max(soft * 3, self.min_time), self.max_time)
+        return soft, hard
+
+    def search(self, engine, board):
+        """
+        Searches the position within the budget.
+
+        Returns (move, stats), stats being {'depth', 'nodes', 'nps', 'time',
+        'budget', 'score', 'stop'}, score being in centipawns for the side
+        to move and stop telling why the search ended:
+        'forced' (only one legal move), 'stable', 'budget' or 'limit' (the
+        engine hit the hard time or max_depth).
+        """
+        soft, hard = self.budget(board)
+        moves = list(board.legal_moves)
+        if len(moves) == 1:
+            return moves[0], {"depth": 0, "nodes": 0, "nps": 0, "time": 0.0, "budget": soft, "score": None, "stop": "forced"}
+
+        start = monotonic()
+        best = None
+        stable = 0
+        depth = 0
+        last_score = None
+        swing = 0
+        stop = "limit"
+
+        limit = chess.engine.Limit(time=hard, depth=self.max_depth)
+        fields = chess.engine.INFO_BASIC | chess.engine.INFO_SCORE | chess.engine.INFO_PV
+        with engine.analysis(board, limit, info=fields) as analysis:
+            for info in analysis:
+                if not info.get("pv") or info.get("depth", 0) <= depth:
+                    continue
+
+                # One more iteration finished
+                depth = info["depth"]
+                stable = stable + 1 if info["pv"][0] == best else 1
+                best = info["pv"][0]
+
+                if "score" in info:
+                    score = info["score"].relative.score(mate_score=100000)
+                    if last_score is not None:
+                        swing = max(swing * 0.5, abs(score - last_score))
+                    last_score = score
+
+                elapsed = monotonic() - start
+                if stable >= self.stable_iterations and depth >= self.min_depth and elapsed >= self.min_time:
+                    stop = "stable"
+                    break
+                if elapsed >= min(soft * (1 + swing / self.volatility_scale), hard):
+                    stop = "budget"
+                    break
+
+        move = analysis.wait().move or best
+        info = analysis.info
+        elapsed = info.get("time", monotonic() - start)
+        nodes = info.get("nodes", 0)
+        return move, {
+            "depth": info.get("depth", depth),
+            "nodes": nodes,
+            "nps": info.get("nps", int(nodes / elapsed) if elapsed else 0),
+            "time": round(elapsed, 3),
+            "budget": round(soft, 3),
+            "score": last_score,
+            "stop": stop,
+        }
@@ -0,0 +1,241 @@
+"""
+Turns a recorded game video into a PGN.
+
+The video is cut into segments that are scanned in parallel for stable
+board states (no motion for --settle seconds). Consecutive states are then
+diffed in parallel with diff_scores(), and the moves are decoded in order
+against a chess.Board, so only legal moves end up in the game.
+
+Usage:
+    python3 src/video_to_pgn.py game.mp4 -o game.pgn [--workers N] [--sample-fps 5]
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from time import perf_counter
+
+import chess
+import chess.pgn
+import cv2
+
+from decoder import decode_move
+from diff import calibrate, diff_scores, frame_matrix
+from watcher import board_thumbnail, changed_fraction
+
+MOTION_THRESHOLD = 0.002
+MIN_CHANGE = 0.005
+MIN_MOVE_FIT = 1.0
+MIN_MOVE_MARGIN = 1.0
+DIFF_RESOLUTION = 400
+
+
+def find_calibration(path, max_frames=300):
+    """
+    Calibrates on the first frame of the video where the red border is found.
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        for _ in range(max_frames):
+            ok, frame = cap.read()
+            if not ok:
+                break
+            try:
+                return calibrate(frame)
+            except Exception:
+                continue
+    finally:
+        cap.release()
+
+    raise Exception("❌ Red border not detected in the first frames of the video.")
+
+
+def scan_segment(path, start, stop, step, calibration, scale=0.125):
+    """
+    Scans frames [start, stop) of the video, one every step frames, and
+    returns the still runs found: consecutive samples without motion.
+
+    Returns:
+        List of dicts with the 'start' and 'end' frame indexes of the run
+        and the 'thumbnail' of its last frame. The frame itself isn't sent
+        back to the parent; read_frame() reads it again when needed.
+    """
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    matrix, size = None, None
+    runs = []
+    run = None
+    previous = None
+
+    for index in range(start, stop):
+        if (index - start) % step:
+            if not cap.grab():
+                break
+            continue
+
+        ok, frame = cap.read()
+        if not ok:
+            break
+
+        if matrix is None:
+            matrix, size = frame_matrix(calibration, frame.shape, scale)
+        small = board_thumbnail(frame, matrix, size)
+
+        if previous is not None and changed_fraction(previous, small) <= MOTION_THRESHOLD:
+            if run is None:
+                run = {"start": index - step}
+            run.update(end=index, thumbnail=small)
+        elif run is not None:
+            runs.append(run)
+            run = None
+
+        previous = small
+
+    if run is not None:
+        runs.append(run)
+
+    cap.release()
+    return runs
+
+
+def stable_states(runs, min_frames):
+    """
+    Merges consecutive still runs showing the same board (a hand hovering
+    without moving anything, or a run split between two segments), then
+    keeps the runs that lasted at least min_frames.
+    """
+    merged = []
+    for run in runs:
+        if merged and changed_fraction(merged[-1]["thumbnail"], run["thumbnail"]) <= MOTION_THRESHOLD:
+            merged[-1].update(end=run["end"], thumbnail=run["thumbnail"])
+        else:
+            merged.append(dict(run))
+
+    states = []
+    for run in merged:
+        if run["end"] - run["start"] < min_frames:
+            continue
+        if states and changed_fraction(states[-1]["thumbnail"], run["thumbnail"]) < MIN_CHANGE:
+            states[-1] = run
+            continue
+        states.append(run)
+
+    return states
+
+
+def read_frame(path, index):
+    cap = cv2.VideoCapture(path)
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ok, frame = cap.read()
+    finally:
+        cap.release()
+    if not ok:
+        raise Exception(f"❌ Could not read frame {index} of the video.")
+    return frame
+
+
+def diff_pair(args):
+    # Frame indexes rather than frames, so no full-size image crosses processes
+    path, before, after, calibration = args
+    return diff_scores(read_frame(path, before), read_frame(path, after), calibration, resolution=DIFF_RESOLUTION)
+
+
+def decode_game(path, states, scores, calibration, board):
+    """
+    Pushes the move between each pair of consecutive states. When a pair
+    doesn't decode (someone's hand was still on the board, for instance),
+    the next state is diffed against the last accepted one instead.
+
+    Returns:
+        The list of (frame index, move) pushed on the board
+    """
+    moves = []
+    reference = 0
+
+    for i in range(1, len(states)):
+        if reference == i - 1:
+            pair_scores = scores[i - 1]
+        else:
+            pair_scores = diff_pair((path, states[reference]["end"], states[i]["end"], calibration))
+
+        move, fit, margin = decode_move(board, pair_scores)
+        if move is None or fit < MIN_MOVE_FIT or margin < MIN_MOVE_MARGIN:
+            continue
+
+        board.push(move)
+        moves.append((states[i]["end"], move))
+        reference = i
+
+        if board.is_game_over():
+            break
+
+    return moves
+
+
+def video_to_pgn(path, workers=None, sample_fps=5.0, settle=0.8, fen=chess.STARTING_FEN):
+    """
+    Returns the chess.pgn.Game recorded in the video and the list of
+    (frame index, move) found.
+    """
+    cap = cv2.VideoCapture(path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+
+    calibration = find_calibration(path)
+    workers = workers or os.cpu_count() or 1
+    step = max(1, int(round(fps / sample_fps)))
+
+    # Segments are multiples of step so every worker samples the same frames a single pass would
+    length = max(step, (total // workers // step + 1) * step)
+    bounds = [(start, min(start + length, total)) for start in range(0, total, length)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        count = len(bounds)
+        segments = pool.map(scan_segment, [path] * count, [start for start, _ in bounds],
+                            [stop for _, stop in bounds], [step] * count, [calibration] * count)
+        runs = [run for segment in segments for run in segment]
+
+        states = stable_states(runs, int(settle * fps))
+        pairs = [(path, states[i]["end"], states[i + 1]["end"], calibration) for i in range(len(states) - 1)]
+        scores = list(pool.map(diff_pair, pairs))
+
+    board = chess.Board(fen)
+    moves = decode_game(path, states, scores, calibration, board)
+
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "ChessBOT"
+    game.headers["Date"] = date.today().strftime("%Y.%m.%d")
+    game.headers["White"] = "Humano"
+    game.headers["Black"] = "ChessBOT"
+
+    return game, moves
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recorded game video to PGN")
+    parser.add_argument("video", help="Video file of the game")
+    parser.add_argument("-o", "--output", help="PGN file to write (default: print)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--sample-fps", type=float, default=5.0, help="Frames per second checked for motion")
+    parser.add_argument("--settle", type=float, default=0.8, help="Seconds without motion for a stable state")
+    parser.add_argument("--fen", default=chess.STARTING_FEN, help="Starting position")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    game, moves = video_to_pgn(args.video, args.workers, args.sample_fps, args.settle, args.fen)
+    elapsed = perf_counter() - start
+
+    pgn = str(game)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(pgn + "\n")
+    else:
+        print(pgn)
+
+    cap = cv2.VideoCapture(args.video)
+    duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / (cap.get(cv2.CAP_PROP_FPS) or 30.0)
+    cap.release()
+    print(f"{len(moves)} moves in {elapsed:.1f}s ({duration / elapsed:.1f}x real time)")
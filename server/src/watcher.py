@@ -0,0 +1,143 @@
+import threading
+
+import cv2
+import numpy as np
+
+from diff import frame_matrix, preprocess_diff
+
+
+def board_thumbnail(frame, matrix=None, size=None, scale=0.125):
+    """
+    Downscaled grayscale view used for the motion checks: the board warped
+    with a frame_matrix() of that scale, or, without a calibration, the
+    whole frame resized.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    if matrix is not None:
+        return cv2.warpPerspective(gray, matrix, size, flags=cv2.INTER_AREA)
+    height, width = gray.shape[:2]
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+def changed_fraction(small1, small2):
+    """
+    Fraction of pixels that differ between two thumbnails, using a light
+    version of preprocess_diff() suited to their small size.
+    """
+    mask = preprocess_diff(small1, small2, blur_ksize=(3, 3), threshold_val=25, morph_kernel_size=(2, 2))
+    return float(np.count_nonzero(mask)) / mask.size
+
+
+class MoveWatcher:
+    """
+    Watches the live camera feed for the opponent's move, so nobody has to
+    press a button: it waits for a hand to enter the board, then for the
+    scene to stay still, and hands the settled frame to on_move if it
+    differs from the reference frame.
+
+    Motion checks run on a small grayscale top-down view of the board
+    (scale of the calibrated size), which is cheap enough to keep up with
+    the camera's frame rate.
+
+    States: 'stopped', 'waiting' (no hand yet), 'moving' (hand on the
+    board) and 'settling' (still, waiting for settle_time). start() and
+    stop() may be called from any thread; each run has its own stop flag,
+    so a thread that outlives stop()'s join never picks up the next run.
+    """
+
+    def __init__(self, grabber, on_move, scale=0.125, motion_threshold=0.002,
+                 min_change=0.005, settle_time=0.8):
+        self.grabber = grabber
+        self.on_move = on_move
+        self.scale = scale
+        self.motion_threshold = motion_threshold
+        self.min_change = min_change
+        self.settle_time = settle_time
+
+        self.state = "stopped"
+        self.motion = 0.0
+        self.change = 0.0
+        self.thread = None
+        self.stopping = threading.Event()
+        self.control = threading.Lock()
+        self.reference = None
+        self.matrix = None
+        self.size = None
+
+    def thumbnail(self, frame):
+        return board_thumbnail(frame, self.matrix, self.size, self.scale)
+
+    def start(self, reference, calibration=None):
+        """
+        Starts watching, comparing the settled board against the reference
+        frame (the board before the opponent's move).
+        """
+        with self.control:
+            self._stop()
+
+            if calibration is not None:
+                self.matrix, self.size = frame_matrix(calibration, reference.shape, self.scale)
+            else:
+                self.matrix, self.size = None, None
+            self.reference = self.thumbnail(reference)
+
+            self.stopping = threading.Event()
+            self.state = "waiting"
+            self.thread = threading.Thread(target=self._run, args=(self.stopping,), name="move-watcher", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=1.0):
+        with self.control:
+            self._stop(timeout)
+
+    def _stop(self, timeout=1.0):
+        self.stopping.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        self.thread = None
+        self.state = "stopped"
+
+    def _run(self, stopping):
+        last_timestamp = 0.0
+        previous = self.reference
+        still_since = None
+
+        while not stopping.is_set():
+            timestamp, frame = self.grabber.newer_than(last_timestamp, timeout=1.0)
+            if frame is None:
+                continue
+            last_timestamp = timestamp
+
+            small = self.thumbnail(frame)
+            self.motion = changed_fraction(previous, small)
+            previous = small
+
+            if self.motion > self.motion_threshold:
+                self.state = "moving"
+                still_since = None
+                continue
+
+            if self.state == "waiting":
+                continue
+
+            if still_since is None:
+                still_since = timestamp
+                self.state = "settling"
+
+            if timestamp - still_since < self.settle_time:
+                continue
+
+            self.change = changed_fraction(self.reference, small)
+            still_since = None
+            self.state = "waiting"
+
+            if self.change >= self.min_change and self.on_move(frame):
+                stopping.set()
+                self.state = "stopped"
+
+    def status(self):
+        return {
+            "state": self.state,
+            "motion": round(self.motion, 4),
+            "change": round(self.change, 4),
+        }
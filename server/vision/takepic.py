@@ -1,14 +1,28 @@
 import cv2
+import os
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from camera import load_settings, open_capture
+
+# Mesmas configurações de câmera do servidor (server/camera.json)
+CAMERA_SETTINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "camera.json")
+
+def abrir_camera():
+    """
+    Abre a câmera configurada em camera.json (ou a câmera 2, se o arquivo não existir)
+    """
+    return open_capture(load_settings(CAMERA_SETTINGS) or 2)
+
 def capturar_fotos_antes_depois():
     """
     Captura duas fotos usando a webcam: uma 'antes' e outra 'depois'
     Salva as imagens como before.jpg e after.jpg
     """
     
-    # Inicializa a câmera (0 é geralmente a câmera padrão)
-    cap = cv2.VideoCapture(2)
+    # Inicializa a câmera
+    cap = abrir_camera()
     
     # Verifica se a câmera foi aberta corretamente
     if not cap.isOpened():
@@ -70,7 +84,7 @@ def capturar_com_delay():
     """
     Versão alternativa: captura as fotos automaticamente com delay
     """
-    cap = cv2.VideoCapture(2)
+    cap = abrir_camera()
     
     if not cap.isOpened():
         print("Erro: Não foi possível acessar a câmera")